@@ -0,0 +1,258 @@
+#!python3
+
+"""
+Offline performance benchmarks for S3Session.
+
+The benchmarks run against moto's in-process S3 stand-in, so no AWS
+credentials or network access are required. They report:
+
+  - upload and download throughput across a range of file sizes,
+  - listing latency across a range of key counts,
+  - the number of S3 requests made by each operation,
+  - the per-call overhead of the S3Session fast paths compared with the
+    equivalent boto3 resource calls.
+
+Absolute timings against the stand-in are not comparable with real S3,
+but changes in request counts and large changes in throughput or
+latency point at regressions in S3Session itself.
+
+Usage (from the package directory):
+    python3 -m benchmarks.s3Benchmark [--sizes 1 16 64] [--keys 100 1000]
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+# Third-party library imports
+import boto3
+try:
+    from moto import mock_aws  # python3 -m pip install moto
+except ImportError:
+    sys.exit("The S3 benchmarks require moto: python3 -m pip install moto")
+
+# Local library imports
+from modules.amazonS3Client import S3Session
+
+
+########################################################################
+BUCKET_NAME = "benchmark-bucket"
+ACCESS_KEY = "benchmark"
+SECRET_KEY = "benchmark"
+
+DEFAULT_FILE_SIZES_MB = [1, 16, 64]
+DEFAULT_KEY_COUNTS = [100, 1000, 5000]
+DEFAULT_REPEAT = 3
+DEFAULT_CALLS = 500
+
+
+########################################################################
+class RequestCounter(object):
+    """
+    Count the S3 requests sent by a client, by operation name.
+    """
+
+    def __init__(self, client):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        client.meta.events.register("before-send.s3", self._count)
+
+    def _count(self, event_name, **kwargs):
+        operation = event_name.rsplit(".", 1)[-1]
+        with self._lock:
+            self.counts[operation] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def summary(self):
+        """
+        Return the request counts as a compact string, e.g.
+        "HeadObject=1 GetObject=4".
+        """
+        with self._lock:
+            return " ".join("{}={}".format(name, count)
+                            for name, count in sorted(self.counts.items()))
+
+
+class Benchmark(object):
+    """
+    Run the S3Session benchmarks against an in-process S3 stand-in.
+    """
+
+    def __init__(self, repeat=DEFAULT_REPEAT):
+        self.repeat = repeat
+        self.workspace = tempfile.mkdtemp(prefix="s3-benchmark-")
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET_NAME)
+        self.s3 = S3Session(BUCKET_NAME, ACCESS_KEY, SECRET_KEY)
+        self.requests = RequestCounter(self.s3.client)
+
+    def close(self):
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def _time(self, function, *args):
+        """
+        Return the best time in seconds of 'self.repeat' calls and the
+        request counts of the final call.
+        """
+        best_time = None
+        for _ in range(self.repeat):
+            self.requests.reset()
+            start_time = time.perf_counter()
+            function(*args)
+            elapsed_time = time.perf_counter() - start_time
+            if best_time is None or elapsed_time < best_time:
+                best_time = elapsed_time
+        return best_time, self.requests.summary()
+
+    #------------------------------------------------------------------
+    def run_transfers(self, file_sizes_mb):
+        """
+        Measure upload and download throughput for each file size.
+        """
+        print("\n ----- TRANSFER THROUGHPUT -----")
+        print("{:>10s} {:>10s} {:>10s}  {}".format("Size (MB)", "Operation", "MB/s", "Requests"))
+
+        src_directory = os.path.join(self.workspace, "src")
+        dst_directory = os.path.join(self.workspace, "dst")
+        os.makedirs(src_directory, exist_ok=True)
+
+        for size_mb in file_sizes_mb:
+            filename = "file-{}MB.bin".format(size_mb)
+            with open(os.path.join(src_directory, filename), "wb") as wf:
+                wf.write(os.urandom(size_mb * 1024 * 1024))
+
+            upload_time, upload_requests = self._time(
+                self.s3.upload_file, src_directory, "transfers", filename)
+            print("{:>10d} {:>10s} {:>10.1f}  {}".format(
+                size_mb, "upload", size_mb / upload_time, upload_requests))
+
+            def download():
+                # Remove the previous copy so every run is a full download.
+                shutil.rmtree(dst_directory, ignore_errors=True)
+                self.s3.download_file("transfers", dst_directory, filename)
+
+            download_time, download_requests = self._time(download)
+            print("{:>10d} {:>10s} {:>10.1f}  {}".format(
+                size_mb, "download", size_mb / download_time, download_requests))
+
+    def run_listings(self, key_counts):
+        """
+        Measure listing latency for each number of keys.
+        """
+        print("\n ----- LISTING LATENCY -----")
+        print("{:>10s} {:>22s} {:>10s}  {}".format("Keys", "Operation", "ms", "Requests"))
+
+        client = self.s3.client
+        for key_count in key_counts:
+            s3_directory = "listing-{}".format(key_count)
+            for index in range(key_count):
+                # Spread the keys over a few sub-directories.
+                key = "{}/sub-{}/{:07d}.txt".format(s3_directory, index % 10, index)
+                client.put_object(Bucket=BUCKET_NAME, Key=key, Body=b"")
+
+            for name, include_subdirectories in [("get_contents(all)", True),
+                                                 ("get_contents(top)", False)]:
+                elapsed_time, requests = self._time(
+                    self.s3.get_contents, s3_directory, include_subdirectories)
+                print("{:>10d} {:>22s} {:>10.1f}  {}".format(
+                    key_count, name, elapsed_time * 1000, requests))
+
+    def run_metadata(self):
+        """
+        Count the requests made by the metadata getters.
+        """
+        print("\n ----- METADATA REQUESTS -----")
+        print("{:>32s} {:>10s}  {}".format("Operation", "ms", "Requests"))
+
+        self.s3.client.put_object(Bucket=BUCKET_NAME, Key="metadata/file.txt", Body=b"data")
+
+        def read_attributes():
+            self.s3.metadata_cache.invalidate()
+            self.s3.get_size("metadata", "file.txt")
+            self.s3.get_etag("metadata", "file.txt")
+            self.s3.get_modified_date("metadata", "file.txt")
+
+        elapsed_time, requests = self._time(read_attributes)
+        print("{:>32s} {:>10.2f}  {}".format("size + etag + modified date", elapsed_time * 1000, requests))
+
+    def run_overhead(self, calls):
+        """
+        Measure the mean time per call of the hot metadata and small
+        object operations.
+        """
+        print("\n ----- PER-CALL OVERHEAD -----")
+        print("{:>32s} {:>10s}".format("Operation", "us/call"))
+
+        resource = boto3.resource("s3", region_name="us-east-1")
+        key = "overhead/file.txt"
+        data = b"x" * 1024
+        self.s3.client.put_object(Bucket=BUCKET_NAME, Key=key, Body=data)
+
+        def resource_head():
+            resource.Object(BUCKET_NAME, key).load()
+
+        def resource_put():
+            resource.Object(BUCKET_NAME, key).put(Body=data)
+
+        def resource_list():
+            list(resource.Bucket(BUCKET_NAME).objects.filter(Prefix="overhead/"))
+
+        operations = [
+            ("resource Object.load()", resource_head),
+            ("S3Session.stat(renew=True)", lambda: self.s3.stat("overhead", "file.txt", renew=True)),
+            ("S3Session.stat() (cached)", lambda: self.s3.stat("overhead", "file.txt")),
+            ("resource Object.put()", resource_put),
+            ("S3Session.upload_fileobj()", lambda: self.s3.upload_fileobj(data, "overhead", "file.txt")),
+            ("resource objects.filter()", resource_list),
+            ("S3Session.get_contents()", lambda: self.s3.get_contents("overhead", use_index=False)),
+        ]
+        for name, function in operations:
+            def run_calls():
+                for _ in range(calls):
+                    function()
+
+            elapsed_time, _ = self._time(run_calls)
+            print("{:>32s} {:>10.1f}".format(name, elapsed_time / calls * 1e6))
+
+
+########################################################################
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark S3Session against an in-process S3 stand-in.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_FILE_SIZES_MB,
+                        help="File sizes to transfer, in MB.")
+    parser.add_argument("--keys", type=int, nargs="+", default=DEFAULT_KEY_COUNTS,
+                        help="Numbers of keys to list.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="Number of runs per measurement; the best is reported.")
+    parser.add_argument("--calls", type=int, default=DEFAULT_CALLS,
+                        help="Number of calls per run of the per-call overhead benchmark.")
+    options = parser.parse_args(args)
+
+    # Make sure no real credentials or endpoints can be picked up.
+    os.environ["AWS_ACCESS_KEY_ID"] = ACCESS_KEY
+    os.environ["AWS_SECRET_ACCESS_KEY"] = SECRET_KEY
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+    with mock_aws():
+        benchmark = Benchmark(options.repeat)
+        try:
+            benchmark.run_transfers(options.sizes)
+            benchmark.run_listings(options.keys)
+            benchmark.run_metadata()
+            benchmark.run_overhead(options.calls)
+        finally:
+            benchmark.close()
+
+
+if __name__ == "__main__":
+    main()
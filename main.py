@@ -40,6 +40,7 @@ def connect_signals_and_slots(Window, Workers):
     """
     # Connect WorkerGroup signals to application slots
     Workers.sigStartController.connect(Workers.controller.start)
+    Workers.sigStartWebClient.connect(Workers.webClient.start)
 
     Workers.controller.sigReleaseQuery.connect(Workers.webClient.handle_release_query)
     Workers.webClient.sigReleaseLatest.connect(Workers.controller.handle_release_latest)
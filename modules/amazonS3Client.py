@@ -15,8 +15,25 @@ Last Updated: 21 March 2020
 
 
 # Standard library imports
+import io
 import os
+import copy
+import base64
+import hashlib
+import time
 import logging
+import re
+import zlib
+import glob
+import bisect
+import itertools
+import zipfile
+import tempfile
+import threading
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 # Logger configuration
 if __name__ == "__main__":
@@ -31,8 +48,75 @@ for name in ['boto', 'urllib3', 's3transfer', 'boto3', 'botocore', 'nose']:
 debugLogger = logging.getLogger(__name__)
 
 # Third-party library imports
-from boto3.session import Session
-from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from s3transfer.utils import ChunksizeAdjuster
+from botocore.exceptions import BotoCoreError, ClientError
+try:
+    import zstandard  # python3 -m pip install zstandard
+except ImportError:
+    zstandard = None
+
+# Local library imports
+from modules import s3ClientPool
+from modules.s3ClientPool import DEFAULT_MAX_POOL_CONNECTIONS
+from modules.s3Bandwidth import PRIORITY_INTERACTIVE, THROTTLE_CHUNK_SIZE, ThrottledReader
+from modules.s3Integrity import EtagHasher, HashingReader, hash_file
+from modules.s3MetadataCache import MetadataCache
+from modules.s3RangeReader import DEFAULT_BLOCK_SIZE, DEFAULT_MAX_BLOCKS, RangeReader
+from modules.s3UploadJournal import is_unchanged
+
+
+########################################################################
+# Default transfer engine settings. These are deliberately generous so
+# that large build artifacts can saturate the link; use
+# S3Session.set_transfer_config() to tune them for a particular site.
+DEFAULT_PART_SIZE = 8 * 1024 * 1024         # bytes per multipart part
+DEFAULT_MAX_CONCURRENCY = 10                # worker threads per transfer
+DEFAULT_MAX_RETRIES = 5                     # attempts per request/part
+DEFAULT_MAX_IN_FLIGHT = 256 * 1024 * 1024   # bytes buffered in memory
+
+# Number of files transferred at the same time by sync_up()/sync_down().
+DEFAULT_SYNC_WORKERS = 8
+
+# Maximum number of keys returned per listing request (S3 caps this at 1000).
+LIST_PAGE_SIZE = 1000
+
+# DeleteObjects accepts at most 1000 keys per request.
+DELETE_BATCH_SIZE = 1000
+DEFAULT_DELETE_WORKERS = 4
+
+# Supported values of the 'compression' argument of upload_file() and
+# upload_fileobj(). These are stored as the object's Content-Encoding.
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+# Maximum number of bytes produced at a time when decompressing a
+# download, so a highly compressible part doesn't inflate into memory
+# all at once.
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of HEAD requests in flight in stat_many().
+DEFAULT_STAT_WORKERS = 16
+
+# keys_exist() checks smaller groups of keys with HEAD requests rather
+# than a listing, as a single listing page could cost as much.
+MIN_KEYS_PER_LISTING = 4
+
+# Block size used to read members of packed archives. Small blocks keep
+# the bytes fetched close to the size of the (small) members.
+PACKED_BLOCK_SIZE = 64 * 1024
+
+# Incomplete multipart uploads older than this are aborted by
+# abort_stale_uploads().
+DEFAULT_STALE_UPLOAD_AGE = 7 * 24 * 60 * 60   # seconds
+
+# S3 only reports modification times to the nearest second.
+MTIME_TOLERANCE = 1.0   # seconds
+
+# Suffix of the partial files written by downloads, named after the
+# object's (single or multipart) ETag.
+PARTIAL_SUFFIX = re.compile(r"\.[0-9a-f]{32}(-\d+)?\.part$")
 
 
 ########################################################################
@@ -41,13 +125,26 @@ class S3Session(object):
     Create an AWS S3 client.
     """
 
-    def __init__(self, bucket_name, access_key, secret_key):
+    def __init__(self, bucket_name, access_key, secret_key,
+                 max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
         """ Initialise the S3Session object.
+
+        The underlying client is shared with every other S3Session using
+        the same credentials, and is safe to use from several threads.
+        Its connection pool is limited to 'max_pool_connections'.
         """
-        self.connect(bucket_name, access_key, secret_key)
-        self._initialise()
+        self.set_transfer_config()
+        self.last_transfer = None
+        self.metadata_cache = MetadataCache()
+        self.artifact_cache = None
+        self.bandwidth_limiter = None
+        self.hash_cache = None
+        self.bucket_index = None
+        self.upload_journal = None
+        self.priority = PRIORITY_INTERACTIVE
+        self.max_pool_connections = max_pool_connections
 
-        self.most_recent_object = None
+        self.connect(bucket_name, access_key, secret_key)
 
     def connect(self, bucket_name, access_key, secret_key):
         """ Start an S3 session.
@@ -65,12 +162,12 @@ class S3Session(object):
 
         Returns
         =======
-        Nothing is returned, but the object variables 'self.s3',
-        'self.bucket' and 'self.bucket_name' will be updated.
+        Nothing is returned, but the object variables 'self.client'
+        and 'self.bucket_name' will be updated.
         """
-        session = Session()
-        self.s3 = session.resource("s3",aws_access_key_id=access_key,
-                                   aws_secret_access_key=secret_key)
+        self.client = s3ClientPool.get_client(access_key, secret_key,
+                                              self.max_pool_connections,
+                                              self.max_retries)
         self.set_bucket(bucket_name)
 
     def set_bucket(self, bucket_name):
@@ -82,11 +179,12 @@ class S3Session(object):
             Name of the bucket to connect to.
 
         Returns:
-        Nothing is returned, but the object variables 'self.bucket' and
-        'self.bucket_name' will be updated.
+        Nothing is returned, but the object variable 'self.bucket_name'
+        will be updated.
         """
-        self.bucket = self.s3.Bucket(bucket_name)
         self.bucket_name = bucket_name
+        self.metadata_cache.invalidate()
+        self._initialise()
 
     def get_bucket_name(self):
         """
@@ -99,20 +197,237 @@ class S3Session(object):
         """
         return self.bucket_name
 
+    def set_transfer_config(self, part_size=DEFAULT_PART_SIZE,
+                            max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                            max_retries=DEFAULT_MAX_RETRIES,
+                            max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                            verify=True):
+        """ Configure the engine used by upload_file() and download_file().
+
+        Files larger than 'part_size' are split into parts which are
+        transferred in parallel by up to 'max_concurrency' threads.
+
+        Parameters
+        ==========
+        part_size: <integer>
+            Size in bytes of each part of a multipart transfer. This is
+            also the size above which multipart transfers are used. S3
+            requires parts of at least 5 MB.
+
+        max_concurrency: <integer>
+            Maximum number of threads used by a single transfer.
+
+        max_retries: <integer>
+            Maximum number of attempts made for each request, including
+            each part of a multipart transfer. This only takes effect
+            on the next call to connect().
+
+        max_in_flight: <integer>
+            Approximate upper limit in bytes of transfer data held in
+            memory at any one time.
+
+        verify: <boolean>
+            Set True to hash data while it is transferred and check it
+            against the S3 ETag. Both single part (MD5) and multipart
+            ETags are supported. Objects encrypted with SSE-KMS do not
+            have MD5-based ETags and can't be downloaded with this
+            enabled.
+
+        Returns
+        =======
+        Nothing is returned, but the object variable
+        'self.transfer_config' will be updated.
+        """
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_in_flight = max_in_flight
+        self.verify = verify
+
+        config = TransferConfig(multipart_threshold=part_size,
+                                multipart_chunksize=part_size,
+                                max_concurrency=max_concurrency)
+
+        # Bound the number of parts which s3transfer may buffer in
+        # memory so large uploads don't exhaust RAM. Downloads are
+        # bounded in the same way by _download().
+        config.max_in_memory_upload_chunks = self._get_parts_in_flight()
+
+        self.transfer_config = config
+
+    def set_artifact_cache(self, artifact_cache):
+        """ Serve repeat downloads from a local content-addressed cache.
+
+        Parameters
+        ==========
+        artifact_cache: <ArtifactCache> or <None>
+            Cache used by download_file() and sync_down(). Downloads
+            whose ETag is already cached are copied (or hardlinked)
+            from the cache instead of being fetched from S3. Set to None
+            to disable caching.
+        """
+        self.artifact_cache = artifact_cache
+
+    def set_hash_cache(self, hash_cache):
+        """ Keep the ETags of local files in a persistent cache.
+
+        Parameters
+        ==========
+        hash_cache: <HashCache> or <None>
+            Cache used by upload_file(skip_unchanged=True) to avoid
+            rehashing files which haven't changed. Set to None to hash
+            files every time.
+        """
+        self.hash_cache = hash_cache
+
+    def set_bucket_index(self, bucket_index):
+        """ Keep a local index of the bucket's contents.
+
+        Parameters
+        ==========
+        bucket_index: <BucketIndex> or <None>
+            Index filled by refresh_index(). Once a directory has been
+            indexed, get_contents() and search() are answered from the
+            index, and the index is kept up to date with this session's
+            uploads and deletes. Set to None to always list from S3.
+        """
+        self.bucket_index = bucket_index
+
+    def set_upload_journal(self, upload_journal):
+        """ Record multipart uploads so they can be resumed.
+
+        Parameters
+        ==========
+        upload_journal: <UploadJournal> or <None>
+            Journal of in-flight multipart uploads. When set, local
+            files larger than one part are uploaded part by part and
+            each completed part is recorded, so an interrupted upload
+            carries on where it stopped (see resume_uploads()). Set to
+            None to use the standard transfer engine.
+        """
+        self.upload_journal = upload_journal
+
+    def set_bandwidth_limiter(self, bandwidth_limiter):
+        """ Limit the bandwidth used by this session's transfers.
+
+        Parameters
+        ==========
+        bandwidth_limiter: <BandwidthLimiter> or <None>
+            Limiter shared by every session (and any other network
+            activity) whose combined bandwidth should be capped. Set to
+            None to remove the limit.
+        """
+        self.bandwidth_limiter = bandwidth_limiter
+
+    def with_priority(self, priority):
+        """
+        Return a view of this session whose transfers belong to another
+        priority class.
+
+        The returned session shares the client, caches and bandwidth
+        limiter of this session, e.g.
+
+            s3.with_priority(PRIORITY_BACKGROUND).upload_file(...)
+
+        Parameters
+        ==========
+        priority: <integer>
+            PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND or PRIORITY_BULK
+            from modules.s3Bandwidth.
+
+        Returns
+        =======
+        <S3Session>
+        """
+        session = copy.copy(self)
+        session.priority = priority
+        return session
+
+    def with_concurrent_transfers(self, transfers):
+        """
+        Return a view of this session for running 'transfers' transfers
+        at the same time.
+
+        The concurrency and memory allowance of each transfer are scaled
+        down so that, together, the transfers use no more connections
+        than the shared client's pool holds ('max_pool_connections')
+        and no more than 'max_in_flight' bytes. Otherwise connections
+        are discarded and reopened instead of being reused.
+
+        Parameters
+        ==========
+        transfers: <integer>
+            Number of transfers which will run concurrently.
+
+        Returns
+        =======
+        <S3Session>
+        """
+        transfers = max(1, transfers)
+        session = copy.copy(self)
+        session.set_transfer_config(
+            part_size=self.part_size,
+            max_concurrency=max(1, min(self.max_concurrency, self.max_pool_connections // transfers)),
+            max_retries=self.max_retries,
+            max_in_flight=max(self.part_size, self.max_in_flight // transfers),
+            verify=self.verify)
+        return session
+
+    @contextmanager
+    def _transfer_activity(self):
+        """
+        Register a transfer with the bandwidth limiter (if any) for the
+        duration of the 'with' block.
+        """
+        if self.bandwidth_limiter is None:
+            yield
+        else:
+            with self.bandwidth_limiter.activity(self.priority):
+                yield
+
+    def _get_parts_in_flight(self):
+        """
+        Return the number of parts which may be held in memory at once.
+        """
+        return max(1, self.max_in_flight // self.part_size)
+
+    def _get_upload_part_size(self, total_bytes=None):
+        """
+        Return the part size s3transfer actually uses for uploads, which
+        is 'self.part_size' clamped to the limits allowed by S3 (and
+        raised if 'total_bytes' would otherwise need too many parts).
+        """
+        return ChunksizeAdjuster().adjust_chunksize(self.part_size, total_bytes)
+
+    def get_last_transfer(self):
+        """
+        Return the statistics of the most recent upload or download.
+
+        Returns
+        =======
+        <TransferMonitor> or <None> if no transfer has been made.
+        """
+        return self.last_transfer
+
     def _initialise(self):
         """
-        Make a dud request to the bucket to initiliase the session.
+        Warm up a connection to the bucket in the background so that
+        the first real request doesn't pay for the TLS handshake.
         """
-        self._key_exists("x", "y")
+        s3ClientPool.warm_up(self.client, self.bucket_name)
 
-    def _get_object(self, s3_directory, filename, renew=True):
+    def stat(self, s3_directory, filename, renew=False):
         """
-        Retrieve an S3 Object.
+        Retrieve the metadata of an S3 Object with a single request.
 
         Description
         ===========
-        For more information about an S3 Object, see:
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#object
+        Metadata is held in 'self.metadata_cache' so that reading
+        several attributes of the same key only costs one request.
+        Stale cache entries are revalidated with a conditional HEAD
+        request (If-None-Match) which returns no body if the object
+        hasn't changed. For more information about the metadata, see:
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.head_object
 
         Parameters
         ==========
@@ -123,13 +438,15 @@ class S3Session(object):
             Name of the file of interest, including file extension.
 
         renew: <boolean>
-            Set True to always request an object from S3. Set False to
-            only request an object if the key has changed from the
-            since the last _get_object() call.
+            Set True to always submit a server request for the S3
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
-        If file is found: <boto3.resources.factory.s3.Object>
+        If file is found: <ObjectStat>
+            Immutable record of the object's size, ETag, content type,
+            content encoding, last modified date, version and expiry.
 
         If file is not found: <None>
             This is only returned if an 404 error is recieved. Any other
@@ -137,40 +454,92 @@ class S3Session(object):
 
         Raises
         ======
-        If an error other than HTTP 404 is returned, an exception will
-        be raised.
+        If an error other than HTTP 304 or 404 is returned, an exception
+        will be raised.
         """
-        s3_filepath = posix_filepath(s3_directory, filename)
+        return self._stat_key(posix_filepath(s3_directory, filename), renew)
+
+    def stat_many(self, s3_filepaths, renew=False, max_workers=DEFAULT_STAT_WORKERS):
+        """
+        Retrieve the metadata of many S3 Objects concurrently.
 
-        # Only retrieve new object information if forced to do so or if
-        # the key has changed.
-        if renew is False:
-            if self.most_recent_object is not None:
-                renew = s3_filepath != self.most_recent_object.key
+        Parameters
+        ==========
+        s3_filepaths: iterable of <strings>
+            Full keys of the files of interest (without the bucket name).
+
+        renew: <boolean>
+            Set True to always submit a server request for each S3
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
-        if renew is True:
-            result = self.s3.Object(self.bucket_name, s3_filepath)
+        max_workers: <integer>
+            Maximum number of requests in flight at the same time.
+
+        Returns
+        =======
+        <dictionary> of S3 key: <ObjectStat>, or <None> if the key
+        doesn't exist.
+        """
+        s3_filepaths = list(s3_filepaths)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda key: self._stat_key(key, renew), s3_filepaths)
+            return dict(zip(s3_filepaths, results))
 
-            # Check if the object exists in S3.
+    def _stat_key(self, s3_filepath, renew=False):
+        """
+        Return the (cached) ObjectStat of 's3_filepath'. See stat().
+        """
+        cached = self.metadata_cache.get(s3_filepath)
+        if cached is not None:
+            metadata, is_fresh = cached
+            if is_fresh is True and renew is False:
+                return metadata
+
+        # Revalidate a stale entry if its ETag is known.
+        if cached is not None and cached[0] is not None:
+            metadata = cached[0]
             try:
-                result.load()
+                response = self._head_object(s3_filepath, IfNoneMatch=metadata.etag)
             except ClientError as err:
-                # ClientError: Object not found
-                if err.response["Error"]["Code"] != "404":
+                # ClientError: Not Modified
+                if err.response["Error"]["Code"] != "304":
                     raise
-                debugLogger.debug("File not found: {}".format(err))
-                result = None
+                self.metadata_cache.refresh(s3_filepath)
+                return metadata
+        else:
+            response = self._head_object(s3_filepath)
+
+        result = ObjectStat.from_response(s3_filepath, response)
+        self.metadata_cache.put(s3_filepath, result)
+        return result
 
-            self.most_recent_object = result
+    def _head_object(self, s3_filepath, **kwargs):
+        """
+        Make a HEAD request for 's3_filepath'.
 
-        else:
-            # Continue to use previous information because the key is
-            # the same as before and a force renew was not given.
-            result = self.most_recent_object
+        Returns
+        =======
+        If file is found: <dictionary>
+        If file is not found: <None>
+        """
+        try:
+            result = self.client.head_object(Bucket=self.bucket_name,
+                                             Key=s3_filepath, **kwargs)
+        except ClientError as err:
+            # ClientError: Object not found
+            if err.response["Error"]["Code"] != "404":
+                raise
+            debugLogger.debug("File not found: {}".format(err))
+            result = None
+
+        # Drop the HTTP details; only the object metadata is kept.
+        if result is not None:
+            result.pop("ResponseMetadata", None)
 
         return result
 
-    def _key_exists(self, s3_directory, filename):
+    def _key_exists(self, s3_directory, filename, renew=False):
         """
         Check if a key exists in S3.
 
@@ -178,183 +547,1505 @@ class S3Session(object):
         =======
         <boolean> True if it exists, False if it doesn't.
         """
-        exists = self._get_object(s3_directory, filename) is not None
-        return exists
+        exists = self.stat(s3_directory, filename, renew) is not None
+        return exists
+
+    def keys_exist(self, s3_filepaths, max_workers=DEFAULT_STAT_WORKERS):
+        """
+        Check which of many keys exist in S3.
+
+        Description
+        ===========
+        Keys are grouped by directory. Each group with enough keys is
+        answered from a listing of the range between its first and last
+        key, which returns up to 1000 keys per request. If the listing
+        turns out to cost more requests than it resolves keys (i.e. the
+        directory holds many other objects) the remaining keys are
+        checked with concurrent HEAD requests instead, as are small
+        groups.
+
+        Parameters
+        ==========
+        s3_filepaths: iterable of <strings>
+            Full keys to check (without the bucket name).
+
+        max_workers: <integer>
+            Maximum number of HEAD requests in flight at the same time.
+
+        Returns
+        =======
+        <set> of the keys in 's3_filepaths' which exist.
+        """
+        groups = defaultdict(list)
+        for s3_filepath in set(s3_filepaths):
+            prefix = s3_filepath[:s3_filepath.rfind("/") + 1]
+            groups[prefix].append(s3_filepath)
+
+        found = set()
+        unresolved = []
+        for prefix, keys in groups.items():
+            if len(keys) < MIN_KEYS_PER_LISTING:
+                unresolved.extend(keys)
+                continue
+
+            hits, remaining = self._list_existing(prefix, sorted(keys))
+            found.update(hits)
+            unresolved.extend(remaining)
+
+        if unresolved:
+            results = self.stat_many(unresolved, max_workers=max_workers)
+            found.update(key for key, metadata in results.items() if metadata is not None)
+
+        return found
+
+    def _list_existing(self, prefix, keys):
+        """
+        Check which of the sorted 'keys' exist by listing 'prefix' from
+        the first key onwards, giving up once the listing stops paying
+        for itself.
+
+        Returns
+        =======
+        <tuple> of (<set> of keys found, <list> of keys left unchecked)
+        """
+        wanted = set(keys)
+        hits = set()
+        # Any string just below the first key will do for StartAfter.
+        start_after = keys[0][:-1]
+
+        for pages, page in enumerate(self._paginate(prefix, StartAfter=start_after), 1):
+            contents = page.get("Contents", [])
+            hits.update(item["Key"] for item in contents if item["Key"] in wanted)
+            if not contents or contents[-1]["Key"] >= keys[-1]:
+                break
+
+            # Every key up to the last one listed has now been answered.
+            resolved = bisect.bisect_right(keys, contents[-1]["Key"])
+            if resolved < pages:
+                debugLogger.debug("Listing '{}' is sparse, checking {} keys individually.".format(
+                    prefix, len(keys) - resolved))
+                return hits, keys[resolved:]
+
+        return hits, []
+
+    #------------------------------------------------------------------
+    def get_contents(self, s3_directory, include_subdirectories=True, use_index=True):
+        """
+        Retrieve the contents located inside the specified directory.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Path to the directory whose contents is of interest. This
+            should not include the bucket name.
+
+        include_subdirectories: <boolean>
+            Indicate whether files in sub-directories should also be
+            returned or not. If set to False then only files and folder
+            names immediately inside 's3_directory' will be returned.
+
+        use_index: <boolean>
+            Set True to answer from the bucket index (see
+            set_bucket_index()) if 's3_directory' has been indexed
+            within the index's maximum age. Set False to always list
+            from S3.
+
+        Returns
+        =======
+        <list> of <strings>
+        A list of filepaths located inside 'self.bucket_name/s3_directory'
+        """
+        root = posix_filepath(s3_directory, "") if s3_directory else ""
+        if (use_index is True and self.bucket_index is not None
+                and self.bucket_index.covers(self.bucket_name, root)):
+            return self.bucket_index.get_contents(self.bucket_name, root, include_subdirectories)
+
+        contents = [filepath
+                    for page in self.iter_contents(s3_directory, include_subdirectories)
+                    for filepath in page]
+        return contents
+
+    def iter_contents(self, s3_directory, include_subdirectories=True,
+                      page_size=LIST_PAGE_SIZE):
+        """
+        Lazily retrieve the contents located inside the specified
+        directory, one page at a time.
+
+        Description
+        ===========
+        Only one page of results is held in memory at a time, so this
+        is suitable for prefixes holding a very large number of keys.
+        When 'include_subdirectories' is False the listing is made with
+        a "/" delimiter, so S3 returns each sub-directory once (as a
+        common prefix) rather than every key inside it.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Path to the directory whose contents is of interest. This
+            should not include the bucket name. Use "" for the whole
+            bucket.
+
+        include_subdirectories: <boolean>
+            Indicate whether files in sub-directories should also be
+            returned or not. If set to False then only files and folder
+            names immediately inside 's3_directory' will be returned.
+
+        page_size: <integer>
+            Maximum number of keys requested per page (up to 1000).
+
+        Yields
+        ======
+        <list> of <strings>
+        A page of filepaths located inside 'self.bucket_name/s3_directory'.
+        Folder names are returned without a trailing "/".
+        """
+        root = posix_filepath(s3_directory, "") if s3_directory else ""
+        delimiter = None if include_subdirectories is True else "/"
+
+        for page in self._paginate(root, delimiter, page_size):
+            contents = [item["Prefix"].rstrip("/") for item in page.get("CommonPrefixes", [])]
+            contents.extend(item["Key"] for item in page.get("Contents", []))
+            yield contents
+
+    def get_all_contents(self):
+        """
+        Retrieve all contents inside the bucket.
+
+        Returns
+        =======
+        <list> of <strings>
+        A list of filenames located inside `self.bucket_name`.
+        """
+        return self.get_contents("")
+
+    def refresh_index(self, s3_directory="", incremental=False):
+        """
+        List 's3_directory' into the bucket index.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Directory to index. Use "" for the whole bucket.
+
+        incremental: <boolean>
+            Set True to only list keys sorting after the last key
+            already indexed in 's3_directory'. This is much faster for
+            directories which are only ever appended to, but doesn't
+            pick up changed or deleted keys. Set False to list the
+            whole directory.
+
+        Returns
+        =======
+        <integer> Number of objects listed.
+        """
+        if self.bucket_index is None:
+            raise ValueError("No bucket index has been set, see set_bucket_index().")
+
+        root = posix_filepath(s3_directory, "") if s3_directory else ""
+        kwargs = {}
+        if incremental is True:
+            last_key = self.bucket_index.get_last_key(self.bucket_name, root)
+            if last_key is not None:
+                kwargs["StartAfter"] = last_key
+
+        return self.bucket_index.refresh(self.bucket_name, root, self._paginate(root, **kwargs),
+                                         incremental=incremental)
+
+    def search(self, s3_directory="", pattern=None, min_size=None, max_size=None):
+        """
+        Search the bucket index (see refresh_index()) without making any
+        requests.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Only objects inside this directory are returned.
+
+        pattern: <string> or <None>
+            Unix shell-style pattern the whole key must match, e.g.
+            "logs/*.csv". Matching is case sensitive and "*" also
+            matches "/".
+
+        min_size, max_size: <integer> or <None>
+            Inclusive bounds of the object size in bytes.
+
+        Returns
+        =======
+        <list> of <IndexEntry> (key, size, etag, last_modified)
+        """
+        if self.bucket_index is None:
+            raise ValueError("No bucket index has been set, see set_bucket_index().")
+
+        root = posix_filepath(s3_directory, "") if s3_directory else ""
+        return self.bucket_index.search(self.bucket_name, root, pattern, min_size, max_size)
+
+    def _paginate(self, prefix, delimiter=None, page_size=LIST_PAGE_SIZE, **kwargs):
+        """
+        Lazily yield raw ListObjectsV2 response pages.
+
+        Parameters
+        ==========
+        prefix: <string>
+            Only keys starting with 'prefix' are listed.
+
+        delimiter: <string> or <None>
+            If given, keys containing 'delimiter' after the prefix are
+            rolled up into the 'CommonPrefixes' of each page.
+
+        page_size: <integer>
+            Maximum number of keys requested per page (up to 1000).
+
+        kwargs:
+            Any further ListObjectsV2 parameters, e.g. StartAfter.
+
+        Yields
+        ======
+        <dictionary> ListObjectsV2 response.
+        """
+        if delimiter is not None:
+            kwargs["Delimiter"] = delimiter
+
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix,
+                                   PaginationConfig={"PageSize": page_size},
+                                   **kwargs)
+        for page in pages:
+            yield page
+
+    #------------------------------------------------------------------
+    def upload_file(self, src_directory, s3_directory, filename, compression=None,
+                    skip_unchanged=False):
+        """
+        Upload 'src_directory/filename' to 's3_directory/filename'.
+
+        The s3 file will be overwritten if it already exists in the
+        destination location ('s3_directory').
+
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Object.upload_file
+
+        Parameters
+        ==========
+        src_directory: <string>
+            Filepath to the directory on the local machine where
+            'filename' is found.
+
+        s3_directory: <string>
+            Filepath to the directory in S3 where 'filename' will be
+            uploaded to.
+
+        filename: <string>
+            Name of the file of interest, including file extension.
+
+        compression: <string> or <None>
+            Set to "gzip" or "zstd" to compress the file while it is
+            uploaded. The S3 object's Content-Encoding is set so that
+            download_file() decompresses it again. "zstd" requires the
+            'zstandard' package.
+
+        skip_unchanged: <boolean>
+            Set True to skip the upload if the S3 object already holds
+            identical data, judged by comparing its ETag with the ETag
+            of the local file. Local ETags are kept in the session's
+            hash cache (see set_hash_cache()) so unchanged files are not
+            hashed again. This is ignored when 'compression' is used.
+
+        Returns
+        =======
+        File exists locally, Upload successful: <boolean> True
+
+        File exists locally, Upload failed: <boolean> False
+            # TODO: (AHA) HOW IS THIS SITUATION HANDLED?
+
+        File does not exist locally: <None>
+        """
+        # Create a filepath from the source directory and filename.
+        src_filepath = posix_filepath(src_directory, filename)
+
+        # If the file exists in S3
+        if os.path.exists(src_filepath) is True:
+
+            # Create a filepath from the destination directory and filename.
+            s3_filepath = posix_filepath(s3_directory, filename)
+
+            # Upload the target file to S3.
+            if compression is None and skip_unchanged is True \
+                    and self._is_uploaded(src_filepath, s3_directory, filename) is True:
+                debugLogger.info("Skipped upload of unchanged file '{}'.".format(s3_filepath))
+                result = True
+            elif compression is None and self.upload_journal is not None \
+                    and os.path.getsize(src_filepath) >= self.transfer_config.multipart_threshold:
+                result = self._upload_resumable(src_filepath, s3_filepath)
+            elif compression is None:
+                result = self._upload(src_filepath, s3_filepath)
+            else:
+                with open(src_filepath, "rb") as rf:
+                    result = self._upload_compressed(rf, s3_filepath, compression,
+                                                     os.path.getsize(src_filepath))
+
+        # If the file doesn't exist in S3
+        else:
+            result = None
+
+        return result
+
+    def download_file(self, s3_directory, dst_directory, filename):
+        """
+        Download 's3_directory/filename' to 'dst_directory/filename'.
+
+        The local filepath ('dst_directory') will be created if it
+        does not already exist. If 'filename' already exists in this
+        location it will be overwritten.
+
+        Files uploaded with compression are decompressed as they are
+        downloaded.
+
+        The data is streamed into a partial file alongside the
+        destination, which is renamed over 'filename' only once the
+        download is complete. If the download fails the partial file is
+        kept and a later call will resume from where it stopped, as long
+        as the S3 object hasn't changed in the meantime.
+
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Object.download_file
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Filepath to the directory in S3 where 'filename' is found.
+
+        dst_directory: <string>
+            Filepath to the directory on the local machine where
+            'filename' should be saved to.
+
+        filename: <string>
+            Name of the file of interest, including file extension.
+
+        Returns
+        =======
+        File exists in S3, Download successful: <boolean> True
+            Filepath where the file was saved on the local machine.
+
+        File exists in S3, Download failed: <boolean> False
+            # TODO: (AHA) HOW IS THIS SITUATION HANDLED?
+
+        File does not exist in S3: <None>
+        """
+        metadata = self.stat(s3_directory, filename, renew=True)
+
+        # If the file exists in S3
+        if metadata is not None:
+
+            # Create a filepath from the source directory and filename.
+            s3_filepath = posix_filepath(s3_directory, filename)
+            dst_filepath = posix_filepath(dst_directory, filename)
+
+            # Create the destination filepath if it doesn't exist
+            if os.path.exists(dst_directory) is not True:
+                os.makedirs(dst_directory)
+
+            # Download the target file. Any existing file is left
+            # untouched unless the download succeeds.
+            result = self._cached_download(s3_filepath, dst_filepath,
+                                           metadata.size, metadata.etag,
+                                           metadata.content_encoding)
+
+        # If the file doesn't exist in S3
+        else:
+            result = None
+
+        return result
+
+    def upload_fileobj(self, data, s3_directory, filename, compression=None):
+        """
+        Upload a file-like object, bytes or a generator of bytes to
+        's3_directory/filename'.
+
+        The s3 file will be overwritten if it already exists in the
+        destination location ('s3_directory').
+
+        Data is read in 'self.part_size' chunks which are uploaded as
+        the parts of a multipart upload, so at most 'max_in_flight'
+        bytes are held in memory however large the upload is. This
+        allows generated reports and logs to be uploaded without first
+        writing them to disk.
+
+        Bytes smaller than one part are sent with a single PutObject
+        request instead.
+
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.upload_fileobj
+
+        Parameters
+        ==========
+        data: <file-like object>, <bytes> or iterable of <bytes>
+            The data to upload. File-like objects must be opened in
+            binary mode and are read from their current position.
+
+        s3_directory: <string>
+            Filepath to the directory in S3 where 'filename' will be
+            uploaded to.
+
+        filename: <string>
+            Name of the file to create, including file extension.
+
+        compression: <string> or <None>
+            Set to "gzip" or "zstd" to compress the data while it is
+            uploaded. See upload_file().
+
+        Returns
+        =======
+        Upload successful: <boolean> True
+
+        Upload failed: <boolean> False
+        """
+        s3_filepath = posix_filepath(s3_directory, filename)
+
+        total_bytes = None
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            total_bytes = len(data)
+            fileobj = io.BytesIO(data)
+        elif hasattr(data, "read"):
+            fileobj = data
+        else:
+            fileobj = io.BufferedReader(IterableStream(data), buffer_size=io.DEFAULT_BUFFER_SIZE)
+
+        if compression is not None:
+            return self._upload_compressed(fileobj, s3_filepath, compression, total_bytes)
+        if total_bytes is not None and total_bytes < self.transfer_config.multipart_threshold:
+            return self._put_object(data, s3_filepath)
+        return self._upload(fileobj, s3_filepath, total_bytes)
+
+    def read_range(self, s3_directory, filename, start, end=None):
+        """
+        Read part of an S3 Object without downloading all of it.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Filepath to the directory in S3 where 'filename' is found.
+
+        filename: <string>
+            Name of the file of interest, including file extension.
+
+        start: <integer>
+            Offset of the first byte to read.
+
+        end: <integer> or <None>
+            Offset just past the last byte to read, as in a slice. Use
+            None to read to the end of the object.
+
+        Returns
+        =======
+        <bytes>, which are shorter than requested if 'end' lies beyond
+        the end of the object.
+
+        Raises
+        ======
+        FileNotFoundError if the object doesn't exist.
+        """
+        s3_filepath = posix_filepath(s3_directory, filename)
+        metadata = self._stat_key(s3_filepath, renew=True)
+        if metadata is None:
+            raise FileNotFoundError("'{}' was not found in S3.".format(s3_filepath))
+
+        end = metadata.size if end is None else min(end, metadata.size)
+        if start >= end:
+            return b""
+
+        with self._transfer_activity():
+            return self._get_range(s3_filepath, start, end - 1, metadata.etag)
+
+    def open_object(self, s3_directory, filename, block_size=DEFAULT_BLOCK_SIZE,
+                    max_blocks=DEFAULT_MAX_BLOCKS):
+        """
+        Open an S3 Object as a seekable, read-only binary stream.
+
+        Description
+        ===========
+        Only the blocks which are read are fetched from S3, and the
+        most recently read blocks are cached, so for example zipfile can
+        list and extract members of a remote archive without
+        downloading the rest of it. Every request is made conditional
+        on the object's ETag, so a read fails rather than mixing data
+        from two versions if the object is replaced.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Filepath to the directory in S3 where 'filename' is found.
+
+        filename: <string>
+            Name of the file of interest, including file extension.
+
+        block_size: <integer>
+            Number of bytes fetched per block.
+
+        max_blocks: <integer>
+            Maximum number of blocks held in memory.
+
+        Returns
+        =======
+        <RangeReader>
+
+        Raises
+        ======
+        FileNotFoundError if the object doesn't exist.
+        """
+        s3_filepath = posix_filepath(s3_directory, filename)
+        metadata = self._stat_key(s3_filepath, renew=True)
+        if metadata is None:
+            raise FileNotFoundError("'{}' was not found in S3.".format(s3_filepath))
+
+        def fetch(start, end):
+            with self._transfer_activity():
+                return self._get_range(s3_filepath, start, end - 1, metadata.etag)
+
+        return RangeReader(fetch, metadata.size, block_size, max_blocks, name=s3_filepath)
+
+    def upload_packed(self, src_directory, filenames, s3_directory, archive_name):
+        """
+        Upload many small files as a single archive.
+
+        Description
+        ===========
+        The files are stored uncompressed in a zip archive, whose
+        central directory at the end of the file indexes the offset of
+        every member. Uploading one archive instead of thousands of
+        small objects costs one or a few requests rather than one per
+        file, and individual members can still be read back with ranged
+        requests (see open_packed() and read_packed()).
+
+        Parameters
+        ==========
+        src_directory: <string>
+            Filepath to the directory on the local machine where the
+            files are found.
+
+        filenames: list of <strings>
+            Names of the files to pack, relative to 'src_directory'.
+            These are also the member names within the archive.
+
+        s3_directory: <string>
+            Filepath to the directory in S3 where the archive will be
+            uploaded to.
+
+        archive_name: <string>
+            Name of the archive to create, e.g. "results.zip".
+
+        Returns
+        =======
+        Upload successful: <boolean> True
+
+        Upload failed: <boolean> False
+        """
+        s3_filepath = posix_filepath(s3_directory, archive_name)
+
+        # Archives smaller than one part are built in memory.
+        with tempfile.SpooledTemporaryFile(max_size=self.part_size) as archive:
+            try:
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+                    for filename in filenames:
+                        zf.write(posix_filepath(src_directory, filename), filename)
+            except OSError as err:
+                debugLogger.error("Upload file failed: {}".format(err))
+                return False
+
+            total_bytes = archive.tell()
+            archive.seek(0)
+            debugLogger.debug("Packed {} files into '{}' ({} bytes).".format(
+                len(filenames), s3_filepath, total_bytes))
+            return self._upload(archive, s3_filepath, total_bytes)
+
+    def open_packed(self, s3_directory, archive_name, block_size=PACKED_BLOCK_SIZE,
+                    max_blocks=DEFAULT_MAX_BLOCKS):
+        """
+        Open an archive uploaded with upload_packed() without
+        downloading it.
+
+        Only the archive's index is fetched when it is opened, and each
+        member read afterwards usually costs a single ranged request.
+        Keep the archive open to read several members.
+
+        Returns
+        =======
+        <PackedArchive>, a read-only <zipfile.ZipFile> which should be
+        closed after use.
+
+        Raises
+        ======
+        FileNotFoundError if the archive doesn't exist.
+        """
+        reader = self.open_object(s3_directory, archive_name, block_size, max_blocks)
+        try:
+            return PackedArchive(reader)
+        except Exception:
+            reader.close()
+            raise
+
+    def read_packed(self, s3_directory, archive_name, filename):
+        """
+        Read a single file from an archive uploaded with upload_packed().
+
+        Returns
+        =======
+        <bytes> contents of 'filename'.
+
+        Raises
+        ======
+        FileNotFoundError if the archive doesn't exist.
+        KeyError if 'filename' isn't in the archive.
+        """
+        with self.open_packed(s3_directory, archive_name) as archive:
+            return archive.read(filename)
+
+    def _is_uploaded(self, src_filepath, s3_directory, filename):
+        """
+        Return True if 's3_directory/filename' already holds the same
+        data as the local file 'src_filepath'.
+        """
+        s3_filepath = posix_filepath(s3_directory, filename)
+        metadata = self.stat(s3_directory, filename, renew=True)
+        if metadata is None:
+            return False
+
+        # Differing sizes can be detected without hashing anything.
+        if metadata.size != os.path.getsize(src_filepath):
+            return False
+
+        etag = metadata.etag
+        part_size = self._get_upload_part_size()
+        if "-" in etag:
+            first_part = self._head_object(s3_filepath, PartNumber=1)
+            if first_part is not None:
+                part_size = first_part["ContentLength"]
+
+        if self.hash_cache is not None:
+            return self.hash_cache.matches(src_filepath, etag, part_size)
+        return hash_file(src_filepath, part_size).matches(etag)
+
+    def _upload_compressed(self, fileobj, s3_filepath, compression, total_bytes=None):
+        """
+        Compress a binary stream while uploading it to 's3_filepath'.
+
+        The compression and, if known, the uncompressed size are also
+        stored in the object's user metadata.
+
+        Returns
+        =======
+        <boolean> True if the upload succeeded, False otherwise.
+        """
+        extra_args = {"ContentEncoding": compression,
+                      "Metadata": {"compression": compression}}
+        if total_bytes is not None:
+            extra_args["Metadata"]["uncompressed-size"] = str(total_bytes)
+
+        compressor = _get_compressor(compression)
+        chunks = _compress_chunks(fileobj, compressor, self.part_size)
+        stream = io.BufferedReader(IterableStream(chunks), buffer_size=io.DEFAULT_BUFFER_SIZE)
+        return self._upload(stream, s3_filepath, extra_args=extra_args)
+
+    def _upload(self, source, s3_filepath, total_bytes=None, extra_args=None):
+        """
+        Upload a local file or a binary file-like object to
+        's3_filepath' using the transfer engine.
+
+        This uses the low-level client, which (unlike the resource
+        objects) is safe to share between threads.
+
+        Parameters
+        ==========
+        source: <string> or <file-like object>
+            Filepath of a local file, or a readable binary stream.
+            Parts of a local file are read in parallel by the transfer
+            threads; streams are read sequentially.
+
+        s3_filepath: <string>
+            Key to upload to.
+
+        total_bytes: <integer> or <None>
+            Size of the upload if known, used for progress reporting.
+            This is found automatically for local files.
+
+        extra_args: <dictionary> or <None>
+            Extra PutObject/CreateMultipartUpload parameters, e.g.
+            ContentType or Metadata.
+
+        Returns
+        =======
+        <boolean> True if the upload succeeded, False otherwise.
+        """
+        # Local files which need to be hashed or throttled are streamed
+        # through the wrappers below, so the data is only read once.
+        if isinstance(source, str):
+            if self.verify is True or self.bandwidth_limiter is not None:
+                with open(source, "rb") as rf:
+                    return self._upload(rf, s3_filepath, os.path.getsize(source), extra_args)
+
+        hasher = None
+        if self.verify is True:
+            hasher = EtagHasher(self._get_upload_part_size())
+            source = HashingReader(source, hasher)
+
+        if self.bandwidth_limiter is not None:
+            source = ThrottledReader(source, self.bandwidth_limiter, self.priority)
+
+        if isinstance(source, str):
+            total_bytes = os.path.getsize(source)
+            upload = self.client.upload_file
+        else:
+            upload = self.client.upload_fileobj
+
+        monitor = TransferMonitor("Upload", s3_filepath, total_bytes)
+        try:
+            with self._transfer_activity():
+                upload(source, self.bucket_name, s3_filepath,
+                       ExtraArgs=extra_args,
+                       Config=self.transfer_config,
+                       Callback=monitor)
+        except Exception as err:
+            debugLogger.error("Upload file failed: {}".format(err))
+            result = False
+        else:
+            result = True
+        finally:
+            self.metadata_cache.invalidate(s3_filepath)
+            self._finish_transfer(monitor)
+
+        if result is True and hasher is not None:
+            result = self._verify_upload(s3_filepath, hasher)
+
+        if result is True:
+            self._index_upload(s3_filepath)
+
+        return result
+
+    def _put_object(self, data, s3_filepath):
+        """
+        Upload small in-memory data with a single PutObject request.
+
+        This skips the transfer engine, whose per-call setup costs more
+        than the request itself for small objects. The Content-MD5
+        header makes S3 reject corrupted data, so no verification
+        request is needed afterwards, and the bucket index is updated
+        from the PutObject response.
+
+        Returns
+        =======
+        <boolean> True if the upload succeeded, False otherwise.
+        """
+        data = bytes(data)
+        content_md5 = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+        monitor = TransferMonitor("Upload", s3_filepath, len(data))
+        try:
+            with self._transfer_activity():
+                if self.bandwidth_limiter is not None:
+                    self.bandwidth_limiter.consume(len(data), self.priority)
+                response = self.client.put_object(Bucket=self.bucket_name, Key=s3_filepath,
+                                                  Body=data, ContentMD5=content_md5)
+            monitor(len(data))
+        except Exception as err:
+            debugLogger.error("Upload file failed: {}".format(err))
+            result = False
+        else:
+            result = True
+        finally:
+            self.metadata_cache.invalidate(s3_filepath)
+            self._finish_transfer(monitor)
+
+        if result is True:
+            # S3 sets the modification date when the upload completes,
+            # so the current time is close enough for the index.
+            self._index_upload(s3_filepath, len(data), response["ETag"],
+                               datetime.now(timezone.utc))
+
+        return result
+
+    def _index_upload(self, s3_filepath, size=None, etag=None, last_modified=None):
+        """
+        Add a newly uploaded key to the bucket index, if there is one.
+        The object's size, ETag and modification date are requested
+        from S3 unless they are all given.
+        """
+        if self.bucket_index is None:
+            return
+
+        if None not in (size, etag, last_modified):
+            self.bucket_index.put(self.bucket_name, s3_filepath, size, etag, last_modified)
+            return
+
+        metadata = self._stat_key(s3_filepath)
+        if metadata is not None:
+            self.bucket_index.put(self.bucket_name, s3_filepath, metadata.size,
+                                  metadata.etag, metadata.last_modified)
+
+    #------------------------------------------------------------------
+    def _upload_resumable(self, src_filepath, s3_filepath):
+        """
+        Upload a local file part by part, recording each completed part
+        in the upload journal.
+
+        If the upload is interrupted, the multipart upload is left in
+        place so that the next upload of the same, unchanged file to
+        's3_filepath' only sends the missing parts. Each part is sent
+        with its Content-MD5, so S3 rejects corrupted parts.
+
+        Returns
+        =======
+        <boolean> True if the upload succeeded, False otherwise.
+        """
+        total_bytes = os.path.getsize(src_filepath)
+        monitor = TransferMonitor("Upload", s3_filepath, total_bytes)
+        try:
+            upload_id, part_size, parts = self._get_multipart_upload(src_filepath, s3_filepath)
+            part_count = max(1, -(-total_bytes // part_size))
+            missing = [number for number in range(1, part_count + 1) if number not in parts]
+
+            def upload_part(number):
+                return number, self._upload_part(src_filepath, s3_filepath, upload_id,
+                                                 number, part_size, monitor)
+
+            workers = min(self.max_concurrency, self._get_parts_in_flight())
+            with self._transfer_activity():
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for number, etag in executor.map(upload_part, missing):
+                        parts[number] = etag
+
+                response = self.client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=s3_filepath, UploadId=upload_id,
+                    MultipartUpload={"Parts": [{"PartNumber": number, "ETag": parts[number]}
+                                               for number in sorted(parts)]})
+        except Exception as err:
+            debugLogger.error("Upload file failed, completed parts are kept to resume later: {}".format(err))
+            result = False
+        else:
+            self.upload_journal.remove(upload_id)
+            result = True
+        finally:
+            self.metadata_cache.invalidate(s3_filepath)
+            self._finish_transfer(monitor)
+
+        # The part ETags are the MD5 checksums S3 has already checked,
+        # so the object's ETag can be verified without rehashing.
+        if result is True and self.verify is True and response.get("ServerSideEncryption") != "aws:kms":
+            digests = b"".join(bytes.fromhex(parts[number].strip('"')) for number in sorted(parts))
+            expected = "{}-{}".format(hashlib.md5(digests).hexdigest(), len(parts))
+            if response["ETag"].strip('"') != expected:
+                debugLogger.error("Uploaded file '{}' has ETag {}, expected \"{}\".".format(
+                    s3_filepath, response["ETag"], expected))
+                result = False
+
+        if result is True:
+            self._index_upload(s3_filepath)
+
+        return result
+
+    def _get_multipart_upload(self, src_filepath, s3_filepath):
+        """
+        Find the journalled multipart upload of 'src_filepath' to
+        's3_filepath', or start a new one. Journalled uploads of a
+        different or modified file to the same key are aborted.
+
+        Returns
+        =======
+        <tuple> of (<string> upload ID, <integer> part size,
+        <dictionary> of part number: ETag of the completed parts)
+        """
+        for entry in self.upload_journal.find(self.bucket_name, s3_filepath):
+            if is_unchanged(entry, src_filepath):
+                uploaded = self._list_uploaded_parts(s3_filepath, entry.upload_id)
+                if uploaded is not None:
+                    parts = {number: etag for number, etag in entry.parts.items()
+                             if uploaded.get(number) == etag}
+                    debugLogger.info("Resuming upload of '{}' with {} parts already uploaded.".format(
+                        s3_filepath, len(parts)))
+                    return entry.upload_id, entry.part_size, parts
+
+            self._abort_upload(s3_filepath, entry.upload_id)
+
+        part_size = self._get_upload_part_size(os.path.getsize(src_filepath))
+        response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=s3_filepath)
+        self.upload_journal.start(self.bucket_name, s3_filepath, response["UploadId"],
+                                  src_filepath, part_size)
+        return response["UploadId"], part_size, {}
+
+    def _upload_part(self, src_filepath, s3_filepath, upload_id, number, part_size, monitor):
+        """
+        Upload part 'number' of a local file and record it in the
+        upload journal.
+
+        Returns
+        =======
+        <string> ETag of the part.
+        """
+        with open(src_filepath, "rb") as rf:
+            rf.seek((number - 1) * part_size)
+            if self.bandwidth_limiter is None:
+                data = rf.read(part_size)
+            else:
+                data = ThrottledReader(rf, self.bandwidth_limiter, self.priority).read(part_size)
+
+        content_md5 = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+        response = self.client.upload_part(Bucket=self.bucket_name, Key=s3_filepath,
+                                           UploadId=upload_id, PartNumber=number,
+                                           Body=data, ContentMD5=content_md5)
+        self.upload_journal.add_part(upload_id, number, response["ETag"])
+        monitor(len(data))
+        return response["ETag"]
+
+    def _list_uploaded_parts(self, s3_filepath, upload_id):
+        """
+        Return the parts S3 holds for a multipart upload.
+
+        Returns
+        =======
+        <dictionary> of part number: ETag, or <None> if the upload no
+        longer exists.
+        """
+        parts = {}
+        paginator = self.client.get_paginator("list_parts")
+        try:
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=s3_filepath,
+                                           UploadId=upload_id):
+                for part in page.get("Parts", []):
+                    parts[part["PartNumber"]] = part["ETag"]
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+            return None
+        return parts
+
+    def _abort_upload(self, s3_filepath, upload_id):
+        """
+        Abort a multipart upload, freeing the storage used by its parts,
+        and remove it from the upload journal.
+        """
+        debugLogger.info("Aborting multipart upload of '{}'.".format(s3_filepath))
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_filepath,
+                                               UploadId=upload_id)
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+        if self.upload_journal is not None:
+            self.upload_journal.remove(upload_id)
+
+    def resume_uploads(self):
+        """
+        Finish every journalled upload to this bucket whose source file
+        is unchanged, and abort the others.
+
+        Returns
+        =======
+        <dictionary> of S3 key: <boolean> True if the upload succeeded,
+        False otherwise.
+        """
+        if self.upload_journal is None:
+            raise ValueError("No upload journal has been set, see set_upload_journal().")
+
+        results = {}
+        for entry in self.upload_journal.get_uploads(self.bucket_name):
+            if is_unchanged(entry, entry.src_filepath):
+                results[entry.key] = self._upload_resumable(entry.src_filepath, entry.key)
+            else:
+                self._abort_upload(entry.key, entry.upload_id)
+        return results
+
+    def abort_stale_uploads(self, s3_directory="", max_age=DEFAULT_STALE_UPLOAD_AGE):
+        """
+        Abort incomplete multipart uploads which were started more than
+        'max_age' seconds ago, so their parts stop incurring storage
+        costs.
+
+        Parameters
+        ==========
+        s3_directory: <string>
+            Only uploads to keys inside this directory are considered.
+            Use "" for the whole bucket.
+
+        max_age: <float>
+            Minimum age in seconds of the uploads to abort.
+
+        Returns
+        =======
+        <list> of the keys whose uploads were aborted.
+        """
+        root = posix_filepath(s3_directory, "") if s3_directory else ""
+        cutoff = time.time() - max_age
+
+        aborted = []
+        paginator = self.client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=root):
+            for upload in page.get("Uploads", []):
+                if upload["Initiated"].timestamp() < cutoff:
+                    self._abort_upload(upload["Key"], upload["UploadId"])
+                    aborted.append(upload["Key"])
+        return aborted
+
+    def _verify_upload(self, s3_filepath, hasher):
+        """
+        Check the ETag of an uploaded object against the data which was
+        sent.
+
+        Returns
+        =======
+        <boolean> True if the ETag matches, False otherwise.
+        """
+        metadata = self._head_object(s3_filepath)
+        self.metadata_cache.put(s3_filepath, ObjectStat.from_response(s3_filepath, metadata))
+
+        if metadata is None:
+            debugLogger.error("Uploaded file '{}' was not found.".format(s3_filepath))
+            return False
+
+        # SSE-KMS ETags are not derived from the MD5 of the data.
+        if metadata.get("ServerSideEncryption") == "aws:kms":
+            debugLogger.debug("Skipped verification of SSE-KMS object '{}'.".format(s3_filepath))
+            return True
+
+        if hasher.matches(metadata["ETag"]) is False:
+            debugLogger.error("Upload of '{}' failed verification: ETag {} does not match the data sent.".format(
+                s3_filepath, metadata["ETag"]))
+            return False
+
+        return True
+
+    def _cached_download(self, s3_filepath, dst_filepath, total_bytes, etag,
+                         content_encoding=None):
+        """
+        Download 's3_filepath' via the artifact cache, if one is set.
+
+        If the object is replaced while it is being downloaded, the
+        download is restarted once with the new version's metadata.
+
+        Returns
+        =======
+        <boolean> True if the download succeeded, False otherwise.
+        """
+        try:
+            return self._cached_download_once(s3_filepath, dst_filepath, total_bytes, etag,
+                                              content_encoding)
+        except ObjectChangedError:
+            metadata = self._stat_key(s3_filepath, renew=True)
+            if metadata is None:
+                debugLogger.error("Download file failed: '{}' was deleted.".format(s3_filepath))
+                return False
+
+        debugLogger.info("Restarting download of '{}', which has changed.".format(s3_filepath))
+        try:
+            return self._cached_download_once(s3_filepath, dst_filepath, metadata.size,
+                                              metadata.etag, metadata.content_encoding)
+        except ObjectChangedError:
+            debugLogger.error("Download file failed: '{}' changed again.".format(s3_filepath))
+            return False
+
+    def _cached_download_once(self, s3_filepath, dst_filepath, total_bytes, etag,
+                              content_encoding=None):
+        """
+        Download a single version of 's3_filepath'. See _cached_download().
+        """
+        if self.artifact_cache is None:
+            return self._download(s3_filepath, dst_filepath, total_bytes, etag,
+                                  content_encoding)
+
+        if self.artifact_cache.fetch(etag, dst_filepath) is True:
+            debugLogger.info("Download of '{}' served from the artifact cache.".format(s3_filepath))
+            return True
+
+        result = self._download(s3_filepath, dst_filepath, total_bytes, etag,
+                                content_encoding)
+        if result is True:
+            self.artifact_cache.store(etag, dst_filepath)
+        return result
+
+    def _download(self, s3_filepath, dst_filepath, total_bytes, etag,
+                  content_encoding=None):
+        """
+        Download 's3_filepath' to a local file using the transfer engine.
+
+        Description
+        ===========
+        The object is fetched in 'self.part_size' byte ranges by up to
+        'self.max_concurrency' threads and the ranges are appended in
+        order to a partial file named after the object's ETag. The
+        partial file is therefore always a complete prefix of the
+        object, so an interrupted download can be resumed with a Range
+        request from its current length. Once complete, the partial file
+        is atomically renamed to 'dst_filepath'.
+
+        Every request is made with If-Match so that a partial file is
+        never completed with data from a newer version of the object.
+
+        If 'self.verify' is True the data is hashed as it is written
+        and checked against 'etag' before the partial file is renamed.
+
+        Objects with a "gzip" or "zstd" Content-Encoding are
+        decompressed as the parts are written, 'DECOMPRESS_CHUNK_SIZE'
+        bytes at a time. The partial file then holds decompressed data,
+        so these downloads always restart from the beginning rather
+        than resuming. The Content-Encoding is taken from the first
+        response, so 'content_encoding' only needs to be known up front
+        to avoid a wasted request when resuming.
+
+        This uses the low-level client, which (unlike the resource
+        objects) is safe to share between threads.
+
+        Parameters
+        ==========
+        s3_filepath: <string>
+            Key of the object to download.
+
+        dst_filepath: <string>
+            Filepath on the local machine to save the object to.
+
+        total_bytes: <integer>
+            Size of the object in bytes.
+
+        etag: <string>
+            ETag of the object.
+
+        content_encoding: <string> or <None>
+            Content-Encoding of the object, if known.
+
+        Returns
+        =======
+        <boolean> True if the download succeeded, False otherwise.
+
+        Raises
+        ======
+        ObjectChangedError if the object no longer has ETag 'etag'.
+        """
+        partial_filepath = "{}.{}.part".format(dst_filepath, etag.strip('"'))
+
+        # Partial downloads of other versions can never be completed.
+        # Only files named like a partial download are removed, so real
+        # files such as "video.mp4.001.part" are left alone.
+        for stale_filepath in glob.glob("{}.*.part".format(glob.escape(dst_filepath))):
+            suffix = stale_filepath[len(dst_filepath):]
+            if stale_filepath != partial_filepath and PARTIAL_SUFFIX.match(suffix):
+                debugLogger.debug("Removing stale partial download '{}'.".format(stale_filepath))
+                os.remove(stale_filepath)
+
+        hasher = self._get_download_hasher(s3_filepath, etag)
+
+        # Resume from the end of an earlier partial download.
+        offset = 0
+        if content_encoding in COMPRESSIONS:
+            if os.path.exists(partial_filepath) is True:
+                os.remove(partial_filepath)
+        elif os.path.exists(partial_filepath) is True:
+            offset = os.path.getsize(partial_filepath)
+            if offset > total_bytes:
+                os.remove(partial_filepath)
+                offset = 0
+            else:
+                debugLogger.info("Resuming download of '{}' from byte {}.".format(s3_filepath, offset))
+                if hasher is not None:
+                    hash_file(partial_filepath, hasher.part_size, hasher)
+
+        monitor = TransferMonitor("Download", s3_filepath, total_bytes)
+        try:
+            with self._transfer_activity(), open(partial_filepath, "ab") as wf:
+                headers = {}
+                parts = self._iter_ranges(s3_filepath, offset, total_bytes, etag, headers)
+                first_part = next(parts, b"")
+                content_encoding = headers.get("ContentEncoding", content_encoding)
+
+                # A partial file of a compressed object holds decompressed
+                # data, so it can't be resumed after all.
+                if offset > 0 and content_encoding in COMPRESSIONS:
+                    parts.close()
+                    wf.truncate(0)
+                    hasher = self._get_download_hasher(s3_filepath, etag)
+                    parts = self._iter_ranges(s3_filepath, 0, total_bytes, etag)
+                    first_part = next(parts, b"")
+
+                chunks = _tap_chunks(itertools.chain([first_part], parts), monitor, hasher)
+                if content_encoding in COMPRESSIONS:
+                    chunks = _decompress_chunks(chunks, content_encoding, DECOMPRESS_CHUNK_SIZE)
+                for data in chunks:
+                    wf.write(data)
+                    wf.flush()
+
+            if hasher is not None and hasher.matches(etag) is False:
+                os.remove(partial_filepath)
+                raise IOError("Downloaded data does not match ETag {}.".format(etag))
+
+            os.replace(partial_filepath, dst_filepath)
+        except ClientError as err:
+            # The object changed since the download started, so the
+            # partial data can never be completed.
+            if err.response["Error"]["Code"] in ("PreconditionFailed", "412"):
+                os.remove(partial_filepath)
+                self.metadata_cache.invalidate(s3_filepath)
+                raise ObjectChangedError(s3_filepath)
+            debugLogger.error("Download file failed: {}".format(err))
+            result = False
+        except Exception as err:
+            debugLogger.error("Download file failed: {}".format(err))
+            result = False
+        else:
+            result = True
+        finally:
+            self._finish_transfer(monitor)
+
+        return result
+
+    def _get_download_hasher(self, s3_filepath, etag):
+        """
+        Return an EtagHasher to verify a download of 's3_filepath', or
+        None if verification is disabled.
 
-    #------------------------------------------------------------------
-    def get_contents(self, s3_directory, include_subdirectories=True):
+        The part size of a multipart object is found by requesting the
+        size of its first part.
         """
-        Retrieve the contents located inside the specified directory.
+        if self.verify is False:
+            return None
 
-        Parameters
-        ==========
-        s3_directory: <string>
-            Path to the directory whose contents is of interest. This
-            should not include the bucket name.
+        part_size = self.part_size
+        if "-" in etag:
+            first_part = self._head_object(s3_filepath, PartNumber=1)
+            if first_part is not None:
+                part_size = first_part["ContentLength"]
 
-        include_subdirectories: <boolean>
-            Indicate whether files in sub-directories should also be
-            returned or not. If set to False then only files immediately
-            inside 's3_directory' will be returned.
+        return EtagHasher(part_size)
 
-        Returns
-        =======
-        <list> of <strings>
-        A list of filepaths located inside 'self.bucket_name/s3_directory'
+    def _iter_ranges(self, s3_filepath, offset, total_bytes, etag, headers=None):
+        """
+        Fetch bytes 'offset' to 'total_bytes' of an object in parallel
+        and yield them in order, one part at a time.
+
+        At most 'self.max_in_flight' bytes of parts are requested ahead
+        of the part currently being yielded. If 'headers' is a
+        dictionary it is filled from the response to the first part
+        before that part is yielded (see _get_range()).
         """
-        # Return all contents extending from 's3_directory'
-        root = posix_filepath(s3_directory)
-        contents = [s3_object.key for s3_object in self.bucket.objects.filter(Prefix=root)]
+        starts = range(offset, total_bytes, self.part_size)
+        window = min(self._get_parts_in_flight(), self.max_concurrency)
 
-        # Return only contents found immediately in 's3_directory',
-        # including folder names.
-        if include_subdirectories is False:
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = deque()
+            try:
+                for start in starts:
+                    end = min(start + self.part_size, total_bytes) - 1
+                    pending.append(executor.submit(self._get_range, s3_filepath, start, end, etag,
+                                                   headers if start == offset else None))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
 
-            root_items = []
-            for filepath in contents:
-                root_item = filepath.split("/")[1]
-                root_item_filepath = posix_filepath(root, root_item)
-                if root_item_filepath not in root_items:
-                    root_items.append(root_item_filepath)
-            contents = root_items
+                while pending:
+                    yield pending.popleft().result()
 
-        return contents
+            finally:
+                for future in pending:
+                    future.cancel()
 
-    def get_all_contents(self):
+    def _get_range(self, s3_filepath, start, end, etag, headers=None):
         """
-        Retrieve all contents inside the bucket.
+        Return bytes 'start' to 'end' (inclusive) of an object.
 
-        Returns
-        =======
-        <list> of <strings>
-        A list of filenames located inside `self.bucket_name`.
+        Reading the response body is retried up to 'self.max_retries'
+        times if the connection drops. Failed requests are already
+        retried by botocore. If a bandwidth limiter is set the body is
+        read in small chunks at the permitted rate. If 'headers' is a
+        dictionary, the response's "ContentEncoding" is stored in it.
         """
-        contents = [s3_object.key for s3_object in self.bucket.objects.all()]
-        return contents
+        kwargs = {"IfMatch": etag} if etag is not None else {}
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.client.get_object(
+                    Bucket=self.bucket_name, Key=s3_filepath,
+                    Range="bytes={}-{}".format(start, end), **kwargs)
+                if headers is not None:
+                    headers["ContentEncoding"] = response.get("ContentEncoding")
+                if self.bandwidth_limiter is None:
+                    return response["Body"].read()
+
+                chunks = []
+                for chunk in response["Body"].iter_chunks(THROTTLE_CHUNK_SIZE):
+                    self.bandwidth_limiter.consume(len(chunk), self.priority)
+                    chunks.append(chunk)
+                return b"".join(chunks)
+            except (BotoCoreError, IOError) as err:
+                if attempt == self.max_retries:
+                    raise
+                debugLogger.warning("Retrying bytes {}-{} of '{}': {}".format(start, end, s3_filepath, err))
 
-    #------------------------------------------------------------------
-    def upload_file(self, src_directory, s3_directory, filename):
+    def _finish_transfer(self, monitor):
         """
-        Upload 'src_directory/filename' to 's3_directory/filename'.
+        Record and log the throughput of a completed transfer.
+        """
+        monitor.finish()
+        self.last_transfer = monitor
+        debugLogger.info(str(monitor))
 
-        The s3 file will be overwritten if it already exists in the
-        destination location ('s3_directory').
+    #------------------------------------------------------------------
+    def sync_up(self, src_directory, s3_directory, max_workers=DEFAULT_SYNC_WORKERS):
+        """
+        Upload every new or modified file in 'src_directory' to
+        's3_directory'.
 
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Object.upload_file
+        Description
+        ===========
+        The remote state is collected with a single paginated listing
+        of 's3_directory'. A local file is uploaded if it does not exist
+        in S3, if its size differs, or if it is newer than the S3 copy
+        and its MD5 checksum doesn't match the S3 ETag. Files are
+        uploaded concurrently and nothing is ever deleted.
 
         Parameters
         ==========
         src_directory: <string>
-            Filepath to the directory on the local machine where
-            'filename' is found.
+            Filepath to the directory on the local machine to upload.
 
         s3_directory: <string>
-            Filepath to the directory in S3 where 'filename' will be
-            uploaded to.
+            Filepath to the directory in S3 which should mirror
+            'src_directory'.
 
-        filename: <string>
-            Name of the file of interest, including file extension.
+        max_workers: <integer>
+            Maximum number of files to upload at the same time.
 
         Returns
         =======
-        File exists locally, Upload successful: <boolean> True
-
-        File exists locally, Upload failed: <boolean> False
-            # TODO: (AHA) HOW IS THIS SITUATION HANDLED?
-
-        File does not exist locally: <None>
+        <dictionary> with the keys "transferred", "unchanged" and
+        "failed", each holding a <list> of S3 keys.
         """
-        # Create a filepath from the source directory and filename.
-        src_filepath = posix_filepath(src_directory, filename)
-
-        # If the file exists in S3
-        if os.path.exists(src_filepath) is True:
-
-            # Create a filepath from the destination directory and filename.
-            s3_filepath = posix_filepath(s3_directory, filename)
-            s3_object = self.s3.Object(self.bucket_name, s3_filepath)
-
-            # Upload the target file to S3.
-            try:
-                s3_object.upload_file(src_filepath)
-            except Exception as err:
-                debugLogger.error("Upload file failed.", err)
-                result = False
-            else:
-                result = True
-
-        # If the file doesn't exist in S3
-        else:
-            result = None
-
-        return result
-
-    def download_file(self, s3_directory, dst_directory, filename):
+        root = posix_filepath(s3_directory, "")
+        remote_objects = self._list_objects(root)
+
+        to_transfer = []
+        unchanged = []
+        for directory, _, filenames in os.walk(src_directory):
+            for filename in filenames:
+                src_filepath = os.path.join(directory, filename)
+                relative_path = os.path.relpath(src_filepath, src_directory)
+                s3_filepath = posix_filepath(root, relative_path)
+
+                remote = remote_objects.get(s3_filepath)
+                if _is_modified(src_filepath, remote, True, self._get_upload_part_size()):
+                    to_transfer.append((src_filepath, s3_filepath))
+                else:
+                    unchanged.append(s3_filepath)
+
+        session = self.with_concurrent_transfers(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(s3_filepath, executor.submit(session._upload, src_filepath, s3_filepath))
+                       for src_filepath, s3_filepath in to_transfer]
+            return _collect_sync_results(futures, unchanged)
+
+    def sync_down(self, s3_directory, dst_directory, max_workers=DEFAULT_SYNC_WORKERS):
         """
-        Download 's3_directory/filename' to 'dst_directory/filename'.
-
-        The local filepath ('dst_directory') will be created if it
-        does not already exist. If 'filename' already exists in this
-        location it will be overwritten.
+        Download every new or modified file in 's3_directory' to
+        'dst_directory'.
 
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Object.download_file
+        Description
+        ===========
+        The remote state is collected with a single paginated listing
+        of 's3_directory'. An S3 file is downloaded if it does not exist
+        locally, if its size differs, or if it is newer than the local
+        copy and the local MD5 checksum doesn't match the S3 ETag.
+        Downloaded files are given the S3 modification time so that
+        the next sync can skip them cheaply. Files are downloaded
+        concurrently and nothing is ever deleted.
+
+        Compressed objects are decompressed when downloaded, which is
+        detected from the first response. The listing doesn't report
+        whether an object is compressed, so an existing local file
+        whose size differs from the object's is checked with a HEAD
+        request, and left alone if it matches the object's stored
+        uncompressed size and modification time. Keys which would be
+        written outside 'dst_directory' (e.g. "dir/../../file") are
+        not downloaded and are reported as failed.
 
         Parameters
         ==========
         s3_directory: <string>
-            Filepath to the directory in S3 where 'filename' is found.
+            Filepath to the directory in S3 to download.
 
         dst_directory: <string>
-            Filepath to the directory on the local machine where
-            'filename' should be saved to.
+            Filepath to the directory on the local machine which should
+            mirror 's3_directory'. It will be created if required.
 
-        filename: <string>
-            Name of the file of interest, including file extension.
+        max_workers: <integer>
+            Maximum number of files to download at the same time.
 
         Returns
         =======
-        File exists in S3, Download successful: <boolean> True
-            Filepath where the file was saved on the local machine.
-
-        File exists in S3, Download failed: <boolean> False
-            # TODO: (AHA) HOW IS THIS SITUATION HANDLED?
-
-        File does not exist in S3: <None>
+        <dictionary> with the keys "transferred", "unchanged" and
+        "failed", each holding a <list> of S3 keys.
         """
-        s3_object = self._get_object(s3_directory, filename)
-
-        # If the file exists in S3
-        if s3_object is not None:
-
-            # Create a filepath from the source directory and filename.
-            dst_filepath = posix_filepath(dst_directory, filename)
+        root = posix_filepath(s3_directory, "")
+        remote_objects = self._list_objects(root)
+
+        to_transfer = []
+        candidates = []
+        unchanged = []
+        skipped = []
+        for s3_filepath, remote in remote_objects.items():
+            # Skip zero-byte "folder" placeholder objects.
+            if s3_filepath.endswith("/"):
+                continue
+
+            dst_filepath = _local_filepath(dst_directory, s3_filepath[len(root):])
+            if dst_filepath is None:
+                debugLogger.error("Skipped '{}', which isn't a safe filepath inside '{}'.".format(s3_filepath, dst_directory))
+                skipped.append(s3_filepath)
+            elif _is_modified(dst_filepath, remote, False, self._get_upload_part_size()) is False:
+                unchanged.append(s3_filepath)
+            elif os.path.exists(dst_filepath) is True and os.path.getsize(dst_filepath) != remote["Size"]:
+                # Possibly a decompressed copy of a compressed object.
+                candidates.append((s3_filepath, dst_filepath))
+            else:
+                to_transfer.append((s3_filepath, dst_filepath, ObjectStat.from_listing(remote)))
+
+        metadata = self.stat_many([s3_filepath for s3_filepath, _ in candidates], renew=True)
+        for s3_filepath, dst_filepath in candidates:
+            remote = metadata[s3_filepath]
+            if remote is None:
+                # Deleted since it was listed.
+                skipped.append(s3_filepath)
+            elif remote.content_encoding is not None \
+                    and _is_decompressed_copy(dst_filepath, remote) is True:
+                unchanged.append(s3_filepath)
+            else:
+                to_transfer.append((s3_filepath, dst_filepath, remote))
 
-            # If the file already exists copy the existing file contents
-            # for data recovery.
-            if os.path.exists(dst_filepath) is True:
-                with open(dst_filepath, "rb") as rf:
-                    backup_data = rf.read()
+        session = self.with_concurrent_transfers(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(s3_filepath, executor.submit(session._sync_download, s3_filepath, dst_filepath, remote))
+                       for s3_filepath, dst_filepath, remote in to_transfer]
+            results = _collect_sync_results(futures, unchanged)
 
-            # Create the destination filepath if it doesn't exist
-            elif os.path.exists(dst_directory) is not True:
-                os.makedirs(dst_directory)
+        results["failed"].extend(skipped)
+        return results
 
-            # Download the target file.
-            try:
-                s3_object.download_file(dst_filepath)
-            except Exception as err:
-                result = False
-                debugLogger.error("Download file failed.", err)
-                with open(dst_filepath, "wb") as wf:
-                    wf.write(backup_data)
-            else:
-                result = True
+    def _sync_download(self, s3_filepath, dst_filepath, remote):
+        """
+        Download a single file for sync_down() and stamp it with the
+        S3 modification time.
+        """
+        os.makedirs(os.path.dirname(dst_filepath) or ".", exist_ok=True)
+        result = self._cached_download(s3_filepath, dst_filepath, remote.size,
+                                       remote.etag, remote.content_encoding)
+        if result is True:
+            mtime = remote.last_modified.timestamp()
+            os.utime(dst_filepath, (mtime, mtime))
+        return result
 
-        # If the file doesn't exist in S3
-        else:
-            result = None
+    def _list_objects(self, prefix):
+        """
+        Return the size, ETag and modification date of every object
+        whose key starts with 'prefix'.
 
-        return result
+        Returns
+        =======
+        <dictionary> of S3 key: <dictionary> as returned in the
+        'Contents' of a ListObjectsV2 response.
+        """
+        objects = {}
+        for page in self._paginate(prefix):
+            for item in page.get("Contents", []):
+                objects[item["Key"]] = item
+        return objects
 
     def delete_file(self, s3_directory, filename):
         """
@@ -384,19 +2075,24 @@ class S3Session(object):
 
         File does not exist in S3: <None>
         """
-        s3_object = self._get_object(s3_directory, filename)
+        metadata = self.stat(s3_directory, filename, renew=True)
 
         # If the file exists in S3
-        if s3_object is not None:
+        if metadata is not None:
 
             # Delete the target file.
+            s3_filepath = posix_filepath(s3_directory, filename)
+            self.metadata_cache.invalidate(s3_filepath)
             try:
-                response = s3_object.delete()
+                self.client.delete_object(Bucket=self.bucket_name,
+                                          Key=s3_filepath)
             except Exception as err:
-                debugLogger.error("Delete file failed.", err)
+                debugLogger.error("Delete file failed: {}".format(err))
                 result = False
             else:
                 result = True
+                if self.bucket_index is not None:
+                    self.bucket_index.remove(self.bucket_name, [s3_filepath])
 
         # If the file doesn't exist in S3
         else:
@@ -404,43 +2100,155 @@ class S3Session(object):
 
         return result
 
-    #------------------------------------------------------------------
-    def get_attribute(self, attribute, s3_directory, filename, renew=True):
+    def delete_many(self, s3_filepaths, max_workers=DEFAULT_DELETE_WORKERS):
+        """
+        Delete many S3 keys using batched DeleteObjects requests.
+
+        Description
+        ===========
+        Keys are deleted in batches of up to 1000 (the S3 maximum) and
+        the batches are sent concurrently. Deleting a key which doesn't
+        exist is reported as a success by S3.
+
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.delete_objects
+
+        Parameters
+        ==========
+        s3_filepaths: iterable of <strings>
+            Full keys of the files to delete (without the bucket name).
 
-        s3_object = self._get_object(s3_directory, filename, renew)
+        max_workers: <integer>
+            Maximum number of batches in flight at the same time.
 
-        if s3_object is not None:
+        Returns
+        =======
+        <dictionary> with the keys:
+            "deleted": <list> of S3 keys which were deleted.
+            "failed": <dictionary> of S3 key: <string> error message.
+        """
+        batch = []
+        batches = []
+        for s3_filepath in s3_filepaths:
+            batch.append(s3_filepath)
+            if len(batch) == DELETE_BATCH_SIZE:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+
+        return self._delete_batches(batches, max_workers)
+
+    def delete_prefix(self, s3_directory, max_workers=DEFAULT_DELETE_WORKERS):
+        """
+        Delete every file inside 's3_directory', including files in
+        sub-directories.
 
-            if attribute == "content_length":
-                result = s3_object.content_length
+        Each page of the listing is deleted as one batch while the rest
+        of the listing is still being retrieved.
 
-            elif attribute == "content_type":
-                result = s3_object.content_type
+        Parameters
+        ==========
+        s3_directory: <string>
+            Path to the directory to delete. This should not include
+            the bucket name.
 
-            elif attribute == "e_tag":
-                result = s3_object.e_tag
+        max_workers: <integer>
+            Maximum number of batches in flight at the same time.
 
-            elif attribute == "expiration":
-                result = s3_object.expiration
+        Returns
+        =======
+        <dictionary> with the keys:
+            "deleted": <list> of S3 keys which were deleted.
+            "failed": <dictionary> of S3 key: <string> error message.
 
-            elif attribute == "expires":
-                result = s3_object.expires
+        Raises
+        ======
+        ValueError if 's3_directory' is empty, to guard against
+        accidentally emptying the whole bucket.
+        """
+        if not s3_directory:
+            raise ValueError("delete_prefix() requires a directory; refusing to empty the bucket.")
 
-            elif attribute == "last_modified":
-                result = s3_object.last_modified
+        return self._delete_batches(self.iter_contents(s3_directory, page_size=DELETE_BATCH_SIZE),
+                                    max_workers)
 
-            elif attribute == "version_id":
-                result = s3_object.version_id
+    def _delete_batches(self, batches, max_workers):
+        """
+        Send a DeleteObjects request for each batch of keys and merge
+        the per-key results.
 
-            else:
-                result = None
+        At most 'max_workers' batches are requested ahead of the batch
+        whose result is currently being collected, so 'batches' may be
+        a lazy iterable of any length.
+        """
+        results = {"deleted": [], "failed": {}}
+
+        def collect(future):
+            deleted, failed = future.result()
+            results["deleted"].extend(deleted)
+            results["failed"].update(failed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for batch in batches:
+                if not batch:
+                    continue
+                pending.append(executor.submit(self._delete_batch, batch))
+                if len(pending) >= max_workers:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+
+        return results
+
+    def _delete_batch(self, s3_filepaths):
+        """
+        Delete up to 1000 keys with a single DeleteObjects request.
 
-        else:
-            result = None
+        Returns
+        =======
+        <tuple> of (<list> deleted keys, <dictionary> key: error message)
+        """
+        for s3_filepath in s3_filepaths:
+            self.metadata_cache.invalidate(s3_filepath)
+
+        try:
+            response = self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in s3_filepaths],
+                        "Quiet": True})
+        except Exception as err:
+            debugLogger.error("Delete batch failed: {}".format(err))
+            return [], {key: str(err) for key in s3_filepaths}
+
+        # In quiet mode S3 only reports the keys which failed.
+        failed = {}
+        for error in response.get("Errors", []):
+            failed[error["Key"]] = "{}: {}".format(error.get("Code"), error.get("Message"))
+        if failed:
+            debugLogger.error("Failed to delete {} of {} files.".format(len(failed), len(s3_filepaths)))
+
+        deleted = [key for key in s3_filepaths if key not in failed]
+        if self.bucket_index is not None:
+            self.bucket_index.remove(self.bucket_name, deleted)
+        return deleted, failed
 
-        return result
+    #------------------------------------------------------------------
+    def get_attribute(self, attribute, s3_directory, filename, renew=False):
+        """
+        Return a single attribute of an S3 Object by its boto3 name, e.g.
+        "content_length" or "e_tag". See stat() to read several
+        attributes at once.
+        """
+        metadata = self.stat(s3_directory, filename, renew)
+
+        field = ATTRIBUTE_FIELDS.get(attribute)
+        if metadata is None or field is None:
+            return None
 
-    def get_size(self, s3_directory, filename, renew=True):
+        return getattr(metadata, field)
+
+    def get_size(self, s3_directory, filename, renew=False):
         """
         Return the size in bytes of an S3 Object.
 
@@ -459,8 +2267,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -471,7 +2279,7 @@ class S3Session(object):
         size_in_bytes = self.get_attribute("content_length", s3_directory, filename, renew)
         return size_in_bytes
 
-    def get_etag(self, s3_directory, filename, renew=True):
+    def get_etag(self, s3_directory, filename, renew=False):
         """
         Return the ETag (entity tag) of an S3 Object.
 
@@ -491,8 +2299,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -504,7 +2312,7 @@ class S3Session(object):
         etag = self.get_attribute("e_tag", s3_directory, filename, renew)
         return etag
 
-    def get_content_type(self, s3_directory, filename, renew=True):
+    def get_content_type(self, s3_directory, filename, renew=False):
         """
         Return the MIME type of the S3 Object.
 
@@ -518,8 +2326,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -531,7 +2339,7 @@ class S3Session(object):
         content_type = self.get_attribute("content_type", s3_directory, filename, renew)
         return content_type
 
-    def get_version(self, s3_directory, filename, renew=True):
+    def get_version(self, s3_directory, filename, renew=False):
         """
         Return the version of the S3 Object.
 
@@ -545,8 +2353,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -559,7 +2367,7 @@ class S3Session(object):
         version_id = self.get_attribute("version_id", s3_directory, filename, renew)
         return version_id
 
-    def get_expiration(self, s3_directory, filename, renew=True):
+    def get_expiration(self, s3_directory, filename, renew=False):
         """
         Return the expiration information of an S3 Object.
 
@@ -580,8 +2388,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -593,7 +2401,7 @@ class S3Session(object):
         expiration_data = self.get_attribute("expiration", s3_directory, filename, renew)
         return expiration_data
 
-    def get_expiry_date(self, s3_directory, filename, renew=True):
+    def get_expiry_date(self, s3_directory, filename, renew=False):
         """
         Return the date and time when the S3 Object will expire.
 
@@ -607,8 +2415,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -620,7 +2428,7 @@ class S3Session(object):
         expiry_date = self.get_attribute("expires", s3_directory, filename, renew)
         return expiry_date
 
-    def get_modified_date(self, s3_directory, filename, renew=True):
+    def get_modified_date(self, s3_directory, filename, renew=False):
         """
         Return the date and time when the S3 Object was last modified.
 
@@ -634,8 +2442,8 @@ class S3Session(object):
 
         renew: <boolean>
             Set True to always submit a server request for the S3
-            Object. Set False to only request an object if the key has
-            changed from the since the last _get_object() call.
+            Object. Set False to use cached metadata while it is
+            younger than the cache TTL.
 
         Returns
         =======
@@ -646,6 +2454,335 @@ class S3Session(object):
         return last_modified_date
 
 
+########################################################################
+class ObjectChangedError(Exception):
+    """
+    Raised when an S3 Object is replaced part way through a transfer.
+    """
+
+
+class ObjectStat(namedtuple("ObjectStat", ["key", "size", "etag", "content_type",
+                                           "content_encoding", "last_modified",
+                                           "version_id", "expiration", "expires",
+                                           "uncompressed_size"])):
+    """
+    Immutable, compact record of an S3 Object's metadata.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, key, response):
+        """
+        Build a record from a HeadObject response.
+
+        Returns
+        =======
+        <ObjectStat>, or <None> if 'response' is None.
+        """
+        if response is None:
+            return None
+
+        # Set by upload_file()/upload_fileobj() when 'compression' is used.
+        uncompressed_size = response.get("Metadata", {}).get("uncompressed-size")
+        if uncompressed_size is not None:
+            uncompressed_size = int(uncompressed_size)
+
+        return cls(key=key,
+                   size=response.get("ContentLength"),
+                   etag=response.get("ETag"),
+                   content_type=response.get("ContentType"),
+                   content_encoding=response.get("ContentEncoding"),
+                   last_modified=response.get("LastModified"),
+                   version_id=response.get("VersionId"),
+                   expiration=response.get("Expiration"),
+                   expires=response.get("Expires"),
+                   uncompressed_size=uncompressed_size)
+
+    @classmethod
+    def from_listing(cls, item):
+        """
+        Build a record from an entry in the 'Contents' of a
+        ListObjectsV2 response. Listings don't report the content type
+        or encoding, so these are None.
+        """
+        return cls(key=item["Key"], size=item["Size"], etag=item["ETag"],
+                   content_type=None, content_encoding=None,
+                   last_modified=item["LastModified"], version_id=None,
+                   expiration=None, expires=None, uncompressed_size=None)
+
+
+# Map the boto3 Object attribute names accepted by get_attribute() to
+# ObjectStat fields.
+ATTRIBUTE_FIELDS = {
+    "content_length": "size",
+    "content_type": "content_type",
+    "e_tag": "etag",
+    "expiration": "expiration",
+    "expires": "expires",
+    "last_modified": "last_modified",
+    "version_id": "version_id",
+}
+
+
+########################################################################
+class TransferMonitor(object):
+    """
+    Track the number of bytes moved by a transfer and its throughput.
+
+    An instance is passed to boto3 as the transfer 'Callback', which
+    may be called concurrently from several worker threads.
+    """
+
+    def __init__(self, direction, key, total_bytes=None):
+        self.direction = direction
+        self.key = key
+        self.total_bytes = total_bytes
+        self.transferred_bytes = 0
+        self.start_time = time.time()
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.transferred_bytes += bytes_amount
+
+    def __str__(self):
+        return "{} of '{}': {} bytes in {:.2f} s ({:.2f} MB/s)".format(
+            self.direction, self.key, self.transferred_bytes,
+            self.get_elapsed_time(), self.get_throughput() / 1e6)
+
+    def finish(self):
+        """
+        Mark the transfer as complete.
+        """
+        self.end_time = time.time()
+
+    def get_elapsed_time(self):
+        """
+        Return the duration of the transfer in seconds.
+        """
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    def get_throughput(self):
+        """
+        Return the average throughput of the transfer in bytes/second.
+        """
+        elapsed_time = self.get_elapsed_time()
+        if elapsed_time <= 0:
+            return 0.0
+        return self.transferred_bytes / elapsed_time
+
+
+########################################################################
+class PackedArchive(zipfile.ZipFile):
+    """
+    Read-only zip archive backed by a RangeReader, which is closed along
+    with the archive.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        super(PackedArchive, self).__init__(reader)
+
+    def close(self):
+        try:
+            super(PackedArchive, self).close()
+        finally:
+            self.reader.close()
+
+
+class IterableStream(io.RawIOBase):
+    """
+    Present an iterable of bytes chunks (e.g. a generator) as a
+    read-only binary stream.
+
+    Only one chunk is held in memory at a time, so a generator can
+    produce an upload of any size.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Skip over empty chunks; an empty result signals end of stream.
+        while not self._buffer:
+            try:
+                self._buffer = bytes(next(self._iterator))
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+#######################################################################
+def _get_compressor(compression):
+    """
+    Return a streaming compressor for "gzip" or "zstd".
+
+    Raises
+    ======
+    ValueError for an unsupported compression, or RuntimeError if zstd
+    is requested without the 'zstandard' package installed.
+    """
+    if compression == COMPRESSION_GZIP:
+        # A wbits value of 31 produces a gzip header and trailer.
+        return zlib.compressobj(wbits=31)
+
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package.")
+        return zstandard.ZstdCompressor().compressobj()
+
+    raise ValueError("Unsupported compression: {}".format(compression))
+
+
+def _compress_chunks(fileobj, compressor, chunk_size):
+    """
+    Read a binary stream in 'chunk_size' blocks and yield it compressed
+    by 'compressor'.
+    """
+    for block in iter(lambda: fileobj.read(chunk_size), b""):
+        yield compressor.compress(block)
+    yield compressor.flush()
+
+
+def _decompress_chunks(chunks, content_encoding, max_length):
+    """
+    Yield the decompressed data of an iterable of "gzip" or "zstd"
+    compressed chunks, at most 'max_length' bytes at a time.
+
+    Raises
+    ======
+    RuntimeError if the chunks are zstd compressed and the 'zstandard'
+    package isn't installed.
+    """
+    if content_encoding == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd decompression requires the 'zstandard' package.")
+        for data in zstandard.ZstdDecompressor().read_to_iter(
+                IterableStream(chunks), write_size=max_length):
+            yield data
+        return
+
+    decompressor = zlib.decompressobj(wbits=31)
+    for data in chunks:
+        while data:
+            yield decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def _tap_chunks(chunks, monitor, hasher):
+    """
+    Yield 'chunks' unchanged, counting them with 'monitor' and hashing
+    them with 'hasher' unless it is None.
+    """
+    for data in chunks:
+        monitor(len(data))
+        if hasher is not None:
+            hasher.update(data)
+        yield data
+
+
+def _is_modified(local_filepath, remote, local_is_source, part_size):
+    """
+    Decide whether a file needs to be transferred during a sync.
+
+    Parameters
+    ==========
+    local_filepath: <string>
+        Filepath to the file on the local machine.
+
+    remote: <dictionary> or <None>
+        Listing entry for the S3 object, or None if it doesn't exist.
+
+    local_is_source: <boolean>
+        True when syncing up (local -> S3), False when syncing down.
+
+    part_size: <integer>
+        Part size assumed for objects with a multipart ETag.
+
+    Returns
+    =======
+    <boolean> True if the file should be transferred.
+    """
+    if remote is None or os.path.exists(local_filepath) is False:
+        return True
+
+    if os.path.getsize(local_filepath) != remote["Size"]:
+        return True
+
+    # Same size and the destination is at least as new as the source.
+    local_mtime = os.path.getmtime(local_filepath)
+    remote_mtime = remote["LastModified"].timestamp()
+    if local_is_source is True:
+        source_is_newer = local_mtime > remote_mtime + MTIME_TOLERANCE
+    else:
+        source_is_newer = remote_mtime > local_mtime + MTIME_TOLERANCE
+    if source_is_newer is False:
+        return False
+
+    # The source has been touched, but it may still hold the same data.
+    # Multipart ETags only match if the object was uploaded with the
+    # same part size; otherwise the file is (safely) transferred again.
+    return hash_file(local_filepath, part_size).matches(remote["ETag"]) is False
+
+
+def _is_decompressed_copy(local_filepath, remote):
+    """
+    Return True if 'local_filepath' is an up to date, decompressed copy
+    of the compressed S3 object described by the ObjectStat 'remote'.
+    Compressed objects can't be compared by ETag, so this relies on the
+    uncompressed size stored when the object was uploaded and on the
+    modification times.
+    """
+    if remote.uncompressed_size is None or os.path.exists(local_filepath) is False:
+        return False
+
+    if os.path.getsize(local_filepath) != remote.uncompressed_size:
+        return False
+
+    remote_mtime = remote.last_modified.timestamp()
+    return remote_mtime <= os.path.getmtime(local_filepath) + MTIME_TOLERANCE
+
+
+def _collect_sync_results(futures, unchanged):
+    """
+    Wait for all sync transfers to complete and summarise the results.
+    """
+    results = {"transferred": [], "unchanged": unchanged, "failed": []}
+    for s3_filepath, future in futures:
+        if future.result() is True:
+            results["transferred"].append(s3_filepath)
+        else:
+            results["failed"].append(s3_filepath)
+    return results
+
+
+def _local_filepath(directory, relative_path):
+    """
+    Return the local filepath of an S3 key relative to 'directory', or
+    None if the key would resolve outside 'directory'.
+    """
+    parts = relative_path.split("/")
+    if any(part in ("", ".", "..") for part in parts) or os.path.isabs(relative_path):
+        return None
+
+    filepath = os.path.join(directory, *parts)
+    root = os.path.abspath(directory)
+    if os.path.commonpath([root, os.path.abspath(filepath)]) != root:
+        return None
+    return filepath
+
+
 #######################################################################
 def posix_filepath(*args):
     """
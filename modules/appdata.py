@@ -41,6 +41,25 @@ VERSION = "0.1.0"
 RELEASE_DATE = "04 April 2020"
 
 
+########################################################################
+# Local Caches
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", PACKAGE_NAME)
+S3_ARTIFACT_CACHE_DIRECTORY = os.path.join(CACHE_DIRECTORY, "s3-artifacts")
+S3_ARTIFACT_CACHE_MAX_SIZE = 5 * 1024 * 1024 * 1024   # bytes
+S3_HASH_CACHE_FILE = os.path.join(CACHE_DIRECTORY, "s3-hashes.sqlite")
+S3_INDEX_FILE = os.path.join(CACHE_DIRECTORY, "s3-index.sqlite")
+S3_INDEX_MAX_AGE = 300.0   # seconds
+S3_UPLOAD_JOURNAL_FILE = os.path.join(CACHE_DIRECTORY, "s3-uploads.sqlite")
+GITHUB_CACHE_FILE = os.path.join(CACHE_DIRECTORY, "github-responses.json")
+GITHUB_CACHE_MAX_AGE = 60.0   # seconds
+
+
+########################################################################
+# Network Limits
+# Maximum bandwidth used by S3 transfers, or None for no limit.
+S3_MAX_BANDWIDTH = None     # bytes/second
+
+
 ########################################################################
 # Action Names
 ACTION_UPDATE_CONFIGURATION = "Update Configuration"
@@ -0,0 +1,175 @@
+#!python3
+
+"""
+An asyncio interface to S3Session.
+
+Each operation is run on a dedicated thread pool using the shared,
+thread-safe S3 client, so many requests can be in flight at once while
+the calling coroutine only awaits the results, e.g.
+
+    s3 = AsyncS3Session(S3Session(bucket, access_key, secret_key))
+    sizes = await asyncio.gather(*[s3.get_size("dir", f) for f in files])
+
+The coroutines can be run with asyncio.run() from a worker QThread, or
+directly on the Qt event loop with an asyncio/Qt bridge such as qasync.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+########################################################################
+# Maximum number of S3 operations in flight at the same time.
+DEFAULT_MAX_WORKERS = 32
+
+
+########################################################################
+class AsyncS3Session(object):
+    """
+    Awaitable counterpart to S3Session.
+    """
+
+    def __init__(self, s3_session, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Parameters
+        ==========
+        s3_session: <S3Session>
+            Session used to make the requests.
+
+        max_workers: <integer>
+            Maximum number of operations run concurrently. Any further
+            operations wait for a free worker. This is capped at the
+            session's 'max_pool_connections'.
+
+        Uploads and downloads run on a view of 's3_session' whose
+        per-transfer concurrency is scaled down, so that 'max_workers'
+        simultaneous transfers still fit in the client's connection
+        pool (see S3Session.with_concurrent_transfers()).
+        """
+        max_workers = max(1, min(max_workers, s3_session.max_pool_connections))
+        self.s3 = s3_session
+        self._transfer_s3 = s3_session.with_concurrent_transfers(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="AsyncS3")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker threads once pending operations finish.
+        """
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, function, *args, **kwargs):
+        """
+        Run a blocking S3Session method on the worker threads.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          functools.partial(function, *args, **kwargs))
+
+    #------------------------------------------------------------------
+    async def stat(self, s3_directory, filename, renew=False):
+        """
+        Return the ObjectStat of 's3_directory/filename', or None if it
+        doesn't exist. See S3Session.stat().
+        """
+        return await self._run(self.s3.stat, s3_directory, filename, renew)
+
+    async def exists(self, s3_directory, filename, renew=False):
+        """
+        Return True if 's3_directory/filename' exists.
+        """
+        return await self._run(self.s3._key_exists, s3_directory, filename, renew)
+
+    async def keys_exist(self, s3_filepaths):
+        """
+        Return the set of keys in 's3_filepaths' which exist. See
+        S3Session.keys_exist().
+        """
+        return await self._run(self.s3.keys_exist, list(s3_filepaths))
+
+    async def get_size(self, s3_directory, filename, renew=False):
+        """
+        Return the size in bytes of 's3_directory/filename'.
+        """
+        return await self._run(self.s3.get_size, s3_directory, filename, renew)
+
+    async def get_etag(self, s3_directory, filename, renew=False):
+        """
+        Return the ETag of 's3_directory/filename'.
+        """
+        return await self._run(self.s3.get_etag, s3_directory, filename, renew)
+
+    async def get_modified_date(self, s3_directory, filename, renew=False):
+        """
+        Return the last modified date of 's3_directory/filename'.
+        """
+        return await self._run(self.s3.get_modified_date, s3_directory, filename, renew)
+
+    async def get_contents(self, s3_directory, include_subdirectories=True):
+        """
+        Return the list of filepaths inside 's3_directory'.
+        """
+        return await self._run(self.s3.get_contents, s3_directory, include_subdirectories)
+
+    #------------------------------------------------------------------
+    async def download(self, s3_directory, dst_directory, filename):
+        """
+        Download 's3_directory/filename' to 'dst_directory/filename'.
+        See S3Session.download_file().
+        """
+        return await self._run(self._transfer_s3.download_file, s3_directory, dst_directory, filename)
+
+    async def read_range(self, s3_directory, filename, start, end=None):
+        """
+        Return bytes 'start' up to 'end' of 's3_directory/filename'.
+        See S3Session.read_range().
+        """
+        return await self._run(self.s3.read_range, s3_directory, filename, start, end)
+
+    async def upload(self, src_directory, s3_directory, filename):
+        """
+        Upload 'src_directory/filename' to 's3_directory/filename'.
+        See S3Session.upload_file().
+        """
+        return await self._run(self._transfer_s3.upload_file, src_directory, s3_directory, filename)
+
+    async def delete(self, s3_directory, filename):
+        """
+        Delete 's3_directory/filename'. See S3Session.delete_file().
+        """
+        return await self._run(self.s3.delete_file, s3_directory, filename)
+
+    #------------------------------------------------------------------
+    async def download_many(self, s3_directory, dst_directory, filenames):
+        """
+        Download several files from 's3_directory' concurrently.
+
+        Returns
+        =======
+        <dictionary> of filename: result of download_file().
+        """
+        results = await asyncio.gather(*[self.download(s3_directory, dst_directory, filename)
+                                         for filename in filenames])
+        return dict(zip(filenames, results))
+
+    async def upload_many(self, src_directory, s3_directory, filenames):
+        """
+        Upload several files from 'src_directory' concurrently.
+
+        Returns
+        =======
+        <dictionary> of filename: result of upload_file().
+        """
+        results = await asyncio.gather(*[self.upload(src_directory, s3_directory, filename)
+                                         for filename in filenames])
+        return dict(zip(filenames, results))
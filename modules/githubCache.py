@@ -0,0 +1,121 @@
+#!python3
+
+"""
+A persistent cache of GitHub REST API responses.
+
+Each response is stored with its ETag and Last-Modified headers. While
+an entry is younger than the cache's maximum age it is used without any
+request at all; after that it is revalidated with a conditional request
+(If-None-Match / If-Modified-Since). GitHub answers an unchanged
+resource with "304 Not Modified", which doesn't count against the rate
+limit, so the data is only downloaded again when it has changed.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import json
+import time
+import logging
+import threading
+debugLogger = logging.getLogger(__name__)
+
+
+########################################################################
+# Number of seconds a response is used without being revalidated.
+DEFAULT_MAX_AGE = 60.0
+
+
+########################################################################
+class ResponseCache(object):
+    """
+    Thread-safe cache of GitHub responses, saved to a JSON file.
+    """
+
+    def __init__(self, filepath, max_age=DEFAULT_MAX_AGE):
+        """
+        Parameters
+        ==========
+        filepath: <string>
+            Filepath of the JSON file holding the cache. It will be
+            created if it does not already exist.
+
+        max_age: <float>
+            Number of seconds a response is used before it is
+            revalidated with GitHub.
+        """
+        self.filepath = filepath
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        try:
+            with open(filepath, "r") as rf:
+                self._entries = json.load(rf)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            debugLogger.warning("Ignoring unreadable GitHub cache '{}': {}".format(filepath, err))
+
+    def get(self, url):
+        """
+        Look up the cached response to 'url'.
+
+        Returns
+        =======
+        <tuple> of (<dictionary> entry, <boolean> is_fresh), or <None>
+        if the URL isn't cached. The entry holds the response "data",
+        its "etag" and "last_modified" headers and the "next" page URL.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            return entry, time.time() - entry["timestamp"] < self.max_age
+
+    def put(self, url, data, etag=None, last_modified=None, next_url=None):
+        """
+        Store the response to 'url' and save the cache to disk.
+        """
+        with self._lock:
+            self._entries[url] = {"data": data, "etag": etag, "last_modified": last_modified,
+                                  "next": next_url, "timestamp": time.time()}
+            self._save()
+
+    def refresh(self, url):
+        """
+        Mark the response to 'url' as fresh, e.g. after GitHub reported
+        that it is unchanged.
+        """
+        with self._lock:
+            if url in self._entries:
+                self._entries[url]["timestamp"] = time.time()
+                self._save()
+
+    def invalidate(self, url=None):
+        """
+        Remove the response to 'url', or every response if None.
+        """
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(url, None)
+            self._save()
+
+    def _save(self):
+        """
+        Atomically write the cache to disk. The lock must be held.
+        """
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_filepath = "{}.tmp".format(self.filepath)
+        try:
+            with open(temp_filepath, "w") as wf:
+                json.dump(self._entries, wf)
+            os.replace(temp_filepath, self.filepath)
+        except OSError as err:
+            debugLogger.warning("Failed to save GitHub cache '{}': {}".format(self.filepath, err))
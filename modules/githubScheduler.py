@@ -0,0 +1,168 @@
+#!python3
+
+"""
+Scheduling of GitHub REST API requests.
+
+The RequestScheduler follows the rate limit reported by GitHub in the
+X-RateLimit-Remaining and X-RateLimit-Reset headers of each response.
+Requests go out immediately while plenty of the budget is left; once it
+runs low the remaining requests are spread evenly until the limit
+resets, and once it is exhausted requests wait for the reset (or fail
+fast with a RateLimitError if that is too far away) instead of being
+rejected by GitHub with a 403.
+
+Identical queries made while one is already in flight, e.g. repeated
+release checks from the menu, are coalesced: only the first makes a
+request and every caller receives its result.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import time
+import logging
+import threading
+debugLogger = logging.getLogger(__name__)
+
+
+########################################################################
+# Requests are spread out once fewer than this many remain.
+DEFAULT_LOW_BUDGET = 50
+
+# Longest time in seconds a request may be delayed before a
+# RateLimitError is raised instead.
+DEFAULT_MAX_WAIT = 60.0
+
+
+########################################################################
+class RateLimitError(Exception):
+    """
+    Raised when a request would have to wait too long for the rate
+    limit to reset.
+    """
+
+    def __init__(self, reset_time):
+        self.reset_time = reset_time
+        super(RateLimitError, self).__init__(
+            "GitHub rate limit exhausted until {}.".format(time.ctime(reset_time)))
+
+
+class _Call(object):
+    """
+    Result of a coalesced call, shared by every waiting caller.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestScheduler(object):
+    """
+    Thread-safe pacing and coalescing of GitHub requests.
+    """
+
+    def __init__(self, low_budget=DEFAULT_LOW_BUDGET, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Parameters
+        ==========
+        low_budget: <integer>
+            Number of remaining requests below which requests are
+            spread evenly until the rate limit resets.
+
+        max_wait: <float>
+            Longest time in seconds to delay a request. Requests which
+            would need to wait longer raise a RateLimitError.
+        """
+        self.low_budget = low_budget
+        self.max_wait = max_wait
+        self.remaining = None
+        self.reset_time = None
+        self._next_time = 0.0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def update(self, remaining, reset_time):
+        """
+        Record the rate limit reported by the latest response.
+
+        Parameters
+        ==========
+        remaining: <integer>
+            Value of the X-RateLimit-Remaining header. Negative values
+            (unknown) are ignored.
+
+        reset_time: <integer>
+            Value of the X-RateLimit-Reset header, in seconds since the
+            epoch.
+        """
+        if remaining is None or remaining < 0 or reset_time is None or reset_time < 0:
+            return
+
+        with self._lock:
+            self.remaining = remaining
+            self.reset_time = reset_time
+
+    def throttle(self):
+        """
+        Wait until a request may be made without exceeding the rate
+        limit.
+
+        Raises
+        ======
+        RateLimitError if the wait would be longer than 'self.max_wait'.
+        """
+        with self._lock:
+            now = time.time()
+            if self.remaining is None or self.reset_time is None or self.reset_time <= now:
+                return
+
+            if self.remaining <= 0:
+                start_time = self.reset_time
+            elif self.remaining < self.low_budget:
+                start_time = max(now, self._next_time)
+                self._next_time = start_time + (self.reset_time - now) / self.remaining
+            else:
+                start_time = now
+
+            delay = start_time - now
+            if delay > self.max_wait:
+                raise RateLimitError(self.reset_time)
+
+            # Count this request until the next response reports the
+            # actual budget.
+            self.remaining -= 1
+
+        if delay > 0:
+            debugLogger.info("Delaying GitHub request by {:.1f} s to stay within the rate limit.".format(delay))
+            time.sleep(delay)
+
+    def coalesce(self, key, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs), unless a call with the same
+        'key' is already in flight, in which case wait for it and return
+        (or raise) its outcome instead.
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            is_owner = call is None
+            if is_owner:
+                call = self._in_flight[key] = _Call()
+
+        if is_owner is False:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
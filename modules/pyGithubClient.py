@@ -28,11 +28,22 @@ Last Updated: 22 March 2020
 
 # Standard library imports
 import os
+import json
 import logging
 debugLogger = logging.getLogger(__name__)
 
 # Third-Party library imports
 from github import Github
+from github.GitRelease import GitRelease
+from github.PaginatedList import PaginatedList
+
+# Local library imports
+from modules.githubScheduler import RequestScheduler
+
+
+########################################################################
+# Number of releases requested per page (GitHub allows up to 100).
+RELEASES_PAGE_SIZE = 100
 
 
 ########################################################################
@@ -41,11 +52,37 @@ class PyGithubClient(object):
 
     def __init__(self, access_token):
         self.client = self._authenticate(access_token)
-        self.user = self.client.get_user()
+        self.response_cache = None
+        self.scheduler = RequestScheduler()
+        self._user = None
+        self._repos = {}
 
     def _authenticate(self, access_token):
         return Github(access_token)
 
+    @property
+    def user(self):
+        """
+        The authenticated user, which is only looked up when first used.
+        """
+        if self._user is None:
+            self._user = self.client.get_user()
+        return self._user
+
+    def set_response_cache(self, response_cache):
+        """
+        Keep release data in a persistent cache.
+
+        Parameters
+        ==========
+        response_cache: <ResponseCache> or <None>
+            Cache used by get_releases() and get_latest_release(). Cached
+            releases are revalidated with conditional requests, which
+            don't count against the rate limit if nothing has changed.
+            Set to None to request releases from GitHub every time.
+        """
+        self.response_cache = response_cache
+
     def print_repo_list(self):
         """
         Print out a list of all available repository names and the
@@ -87,7 +124,11 @@ class PyGithubClient(object):
             Name of the repository.
         """
         repo = "{}/{}".format(organisation, repo_name)
-        return self.client.get_repo(repo)
+        if repo not in self._repos:
+            # The repository's details are only requested once one of
+            # its attributes is read.
+            self._repos[repo] = self.client.get_repo(repo, lazy=True)
+        return self._repos[repo]
 
     def get_releases(self, organisation, repo_name):
         """
@@ -101,8 +142,26 @@ class PyGithubClient(object):
         repo_name: <string>
             Name of the repository.
         """
-        repo = self.get_repo(organisation, repo_name)
-        return repo.get_releases()
+        return self.scheduler.coalesce(("releases", organisation, repo_name),
+                                       self._get_releases, organisation, repo_name)
+
+    def _get_releases(self, organisation, repo_name):
+        if self.response_cache is not None:
+            url = "/repos/{}/{}/releases?per_page={}".format(organisation, repo_name,
+                                                             RELEASES_PAGE_SIZE)
+            releases = []
+            while url is not None:
+                headers, data, url = self._get_cached(url)
+                releases.extend(self.client.create_from_raw_data(GitRelease, item, headers)
+                                for item in data)
+            return releases
+
+        # The pages are fetched here, rather than lazily by the caller,
+        # so every coalesced caller can share the same list.
+        url = "/repos/{}/{}/releases".format(organisation, repo_name)
+        releases = PaginatedList(GitRelease, self.client.requester, url,
+                                 {"per_page": RELEASES_PAGE_SIZE})
+        return self._request(list, releases)
 
     def get_latest_release(self, organisation, repo_name):
         """
@@ -116,10 +175,86 @@ class PyGithubClient(object):
         repo_name: <string>
             Name of the repository.
         """
-        repo = self.get_repo(organisation, repo_name)
-        return repo.get_latest_release()
+        return self.scheduler.coalesce(("latest_release", organisation, repo_name),
+                                       self._get_latest_release, organisation, repo_name)
+
+    def _get_latest_release(self, organisation, repo_name):
+        if self.response_cache is not None:
+            url = "/repos/{}/{}/releases/latest".format(organisation, repo_name)
+            headers, data, _ = self._get_cached(url)
+            return self.client.create_from_raw_data(GitRelease, data, headers)
+
+        url = "/repos/{}/{}/releases/latest".format(organisation, repo_name)
+        headers, data = self._request(self.client.requester.requestJsonAndCheck, "GET", url)
+        return self.client.create_from_raw_data(GitRelease, data, headers)
+
+    def _request(self, function, *args):
+        """
+        Call function(*args), which makes GitHub requests, once the rate
+        limit allows it, and record the rate limit reported afterwards.
+        """
+        self.scheduler.throttle()
+        try:
+            return function(*args)
+        finally:
+            requester = self.client.requester
+            self.scheduler.update(requester.rate_limiting[0], requester.rate_limiting_resettime)
+
+    def _get_cached(self, url):
+        """
+        GET a REST API URL through the response cache.
+
+        Fresh cached responses are returned without a request. Stale
+        ones are revalidated with If-None-Match / If-Modified-Since.
+
+        Returns
+        =======
+        <tuple> of (<dictionary> response headers, decoded JSON data,
+        <string> URL of the next page or <None>)
+        """
+        cached = self.response_cache.get(url)
+        if cached is not None and cached[1] is True:
+            entry = cached[0]
+            return {}, entry["data"], entry["next"]
+
+        request_headers = {}
+        if cached is not None:
+            entry = cached[0]
+            if entry["etag"] is not None:
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        requester = self.client.requester
+        status, headers, output = self._request(requester.requestJson, "GET", url,
+                                                None, request_headers)
+        if status == 304:
+            debugLogger.debug("GitHub response to '{}' is unchanged.".format(url))
+            self.response_cache.refresh(url)
+            return headers, entry["data"], entry["next"]
+
+        data = json.loads(output) if output else None
+        if status >= 400:
+            raise requester.createException(status, headers, data)
+
+        next_url = _get_next_url(headers)
+        self.response_cache.put(url, data, headers.get("etag"), headers.get("last-modified"),
+                                next_url)
+        return headers, data, next_url
 
 #######################################################################
+def _get_next_url(headers):
+    """
+    Return the URL of the next page from a response's Link header, or
+    None if it is the last page.
+    """
+    for link in headers.get("link", "").split(","):
+        parts = link.split(";")
+        if len(parts) > 1 and parts[1].strip() == 'rel="next"':
+            return parts[0].strip()[1:-1]
+    return None
+
+
 def print_GitRelease(git_release_object):
     print("{:>15s}: {}".format("Title", git_release_object.title))
     print("{:>15s}: {}".format("Tag Name", git_release_object.tag_name))
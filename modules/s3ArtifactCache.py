@@ -0,0 +1,202 @@
+#!python3
+
+"""
+A content-addressed, on-disk cache of files downloaded from S3.
+
+Files are stored under their S3 ETag, so a download whose ETag matches
+a cached blob can be served locally without a GET request. The total
+size of the cache is capped and the least recently used blobs are
+evicted first.
+
+When a blob is used it is recorded by touching an empty marker file of
+its own, rather than the blob itself. Hardlinked copies share the
+blob's modification time, so it can't be used to track recency.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import shutil
+import logging
+import threading
+debugLogger = logging.getLogger(__name__)
+
+
+########################################################################
+DEFAULT_MAX_SIZE = 5 * 1024 * 1024 * 1024   # bytes
+
+# Sub-directory holding the marker file of each blob, whose modification
+# time records when the blob was last used.
+USAGE_DIRECTORY = ".used"
+
+
+########################################################################
+class ArtifactCache(object):
+    """
+    ETag-keyed cache of S3 objects with LRU eviction.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, use_hardlinks=False):
+        """
+        Parameters
+        ==========
+        directory: <string>
+            Filepath to the directory where cached files are kept. It
+            will be created if it does not already exist.
+
+        max_size: <integer>
+            Maximum total size of the cache in bytes.
+
+        use_hardlinks: <boolean>
+            Set True to hardlink cached files into place instead of
+            copying them. This is much faster for large files and saves
+            disk space, but a file which is later modified in place will
+            also modify the cached copy. If hardlinking fails (e.g. the
+            destination is on another drive) the file is copied.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.use_hardlinks = use_hardlinks
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.directory, USAGE_DIRECTORY), exist_ok=True)
+
+    def _get_blob_filepath(self, etag):
+        """
+        Return the filepath of the blob cached for 'etag'.
+        """
+        return os.path.join(self.directory, etag.strip('"'))
+
+    def _get_marker_filepath(self, blob_filepath):
+        """
+        Return the filepath of the marker recording when the blob at
+        'blob_filepath' was last used.
+        """
+        return os.path.join(self.directory, USAGE_DIRECTORY, os.path.basename(blob_filepath))
+
+    def _mark_used(self, blob_filepath):
+        """
+        Record that the blob at 'blob_filepath' has just been used.
+        """
+        marker_filepath = self._get_marker_filepath(blob_filepath)
+        try:
+            with open(marker_filepath, "a"):
+                pass
+            os.utime(marker_filepath)
+        except OSError:
+            pass
+
+    def contains(self, etag):
+        """
+        Return True if a blob with this ETag is cached.
+        """
+        return os.path.exists(self._get_blob_filepath(etag))
+
+    def fetch(self, etag, dst_filepath):
+        """
+        Place the cached blob for 'etag' at 'dst_filepath'.
+
+        Returns
+        =======
+        <boolean> True if the blob was cached, False otherwise.
+        """
+        blob_filepath = self._get_blob_filepath(etag)
+        try:
+            _place(blob_filepath, dst_filepath, self.use_hardlinks)
+        except FileNotFoundError:
+            return False
+
+        self._mark_used(blob_filepath)
+        return True
+
+    def store(self, etag, src_filepath):
+        """
+        Add a copy of 'src_filepath' to the cache under 'etag' and evict
+        old blobs if the cache is over its size limit.
+        """
+        blob_filepath = self._get_blob_filepath(etag)
+        if os.path.exists(blob_filepath) is False:
+            try:
+                _place(src_filepath, blob_filepath, self.use_hardlinks)
+            except OSError as err:
+                debugLogger.warning("Could not cache '{}': {}".format(src_filepath, err))
+                return
+        self._mark_used(blob_filepath)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used blobs until the cache is no
+        larger than 'self.max_size'.
+        """
+        with self._lock:
+            blobs = []
+            total_size = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_file() is False or entry.name.endswith(".tmp"):
+                    continue
+                size = entry.stat().st_size
+                blobs.append((self._get_last_used(entry.path), size, entry.path))
+                total_size += size
+
+            blobs.sort()
+            for _, size, blob_filepath in blobs:
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(blob_filepath)
+                except OSError:
+                    continue
+                _remove_if_exists(self._get_marker_filepath(blob_filepath))
+                total_size -= size
+                debugLogger.debug("Evicted '{}' from the artifact cache.".format(blob_filepath))
+
+    def _get_last_used(self, blob_filepath):
+        """
+        Return the time the blob at 'blob_filepath' was last used, or 0
+        if it has no marker (e.g. it was cached by an older version).
+        """
+        try:
+            return os.stat(self._get_marker_filepath(blob_filepath)).st_mtime
+        except OSError:
+            return 0.0
+
+    def clear(self):
+        """
+        Remove every blob from the cache.
+        """
+        with self._lock:
+            for directory in (self.directory, os.path.join(self.directory, USAGE_DIRECTORY)):
+                for entry in os.scandir(directory):
+                    if entry.is_file():
+                        os.remove(entry.path)
+
+
+#######################################################################
+def _place(src_filepath, dst_filepath, use_hardlinks):
+    """
+    Atomically hardlink or copy 'src_filepath' to 'dst_filepath'.
+    """
+    tmp_filepath = "{}.{}.tmp".format(dst_filepath, threading.get_ident())
+    try:
+        if use_hardlinks is True:
+            try:
+                os.link(src_filepath, tmp_filepath)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(src_filepath, tmp_filepath)
+        else:
+            shutil.copyfile(src_filepath, tmp_filepath)
+        os.replace(tmp_filepath, dst_filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+
+def _remove_if_exists(filepath):
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
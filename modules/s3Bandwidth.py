@@ -0,0 +1,164 @@
+#!python3
+
+"""
+Bandwidth limiting and prioritisation of S3 traffic.
+
+A BandwidthLimiter is a token bucket shared by every transfer which
+should be limited. Transfers belong to a priority class; while a
+transfer of a higher priority class is active, lower priority transfers
+only receive a small share of the bandwidth so that, for example, a
+bulk log upload doesn't starve an interactive configuration fetch.
+Lower priority transfers are slowed rather than paused completely so
+that their connections are not timed out by S3.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+########################################################################
+# Priority classes, from highest to lowest priority.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BULK = 2
+
+# Share of the bandwidth left to a transfer while a higher priority
+# transfer is active.
+DEFAULT_YIELD_SHARE = 0.05
+
+# Number of bytes read from a stream between checks of the bandwidth
+# limit.
+THROTTLE_CHUNK_SIZE = 64 * 1024
+
+
+########################################################################
+class BandwidthLimiter(object):
+    """
+    Thread-safe token bucket limiting the combined throughput of all the
+    transfers which use it.
+    """
+
+    def __init__(self, max_bytes_per_second, yield_share=DEFAULT_YIELD_SHARE):
+        """
+        Parameters
+        ==========
+        max_bytes_per_second: <integer>
+            Maximum combined throughput of all transfers.
+
+        yield_share: <float>
+            Share (0 to 1) of the bandwidth given to a transfer while a
+            higher priority transfer is active.
+        """
+        self.yield_share = yield_share
+        self._active = Counter()
+        self._lock = threading.Lock()
+        self.set_rate(max_bytes_per_second)
+
+    def set_rate(self, max_bytes_per_second):
+        """
+        Change the maximum combined throughput. Up to one second of
+        data may be sent in a burst.
+        """
+        with self._lock:
+            self.rate = float(max_bytes_per_second)
+            self._tokens = self.rate
+            self._timestamp = time.monotonic()
+            self._yield_buckets = {}
+
+    @contextmanager
+    def activity(self, priority):
+        """
+        Mark a transfer (or any other network activity, e.g. a GitHub
+        request) of the given priority as active for the duration of
+        the 'with' block.
+        """
+        with self._lock:
+            self._active[priority] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[priority] -= 1
+
+    def _is_outranked(self, priority):
+        """
+        Return True if a higher priority activity is in progress. The
+        lock must be held.
+        """
+        return any(count > 0 for other, count in self._active.items() if other < priority)
+
+    def consume(self, amount, priority):
+        """
+        Account for 'amount' bytes sent or received, blocking as long as
+        is required to keep within the bandwidth limit.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate
+
+            # Outranked transfers are additionally held to 'yield_share'
+            # of the bandwidth by a bucket of their own. Only the bytes
+            # actually sent are taken from the shared bucket, so the
+            # higher priority transfers keep the rest of the bandwidth.
+            if self._is_outranked(priority):
+                delay = max(delay, self._consume_yield(amount, priority, now))
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def _consume_yield(self, amount, priority, now):
+        """
+        Take 'amount' from the yield bucket of 'priority' and return the
+        time in seconds needed to pay off its deficit. The lock must be
+        held.
+        """
+        rate = self.rate * self.yield_share
+        tokens, timestamp = self._yield_buckets.get(priority, (rate, now))
+        tokens = min(rate, tokens + (now - timestamp) * rate) - amount
+        self._yield_buckets[priority] = (tokens, now)
+        return -tokens / rate
+
+
+class ThrottledReader(object):
+    """
+    Wrap a readable binary stream so that reads are limited by a
+    BandwidthLimiter. When used for uploads this limits the average
+    upload rate, as the transfer engine can only send what it has read.
+
+    Like HashingReader, the wrapper is not seekable so the stream is
+    read once from start to end.
+    """
+
+    def __init__(self, fileobj, limiter, priority):
+        self._fileobj = fileobj
+        self._limiter = limiter
+        self._priority = priority
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # Large reads (e.g. a whole multipart part) are accounted for in
+        # small chunks so the data is released at a steady rate.
+        if size is None or size < 0:
+            size = float("inf")
+
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self._fileobj.read(int(min(remaining, THROTTLE_CHUNK_SIZE)))
+            if not chunk:
+                break
+            self._limiter.consume(len(chunk), self._priority)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return b"".join(chunks)
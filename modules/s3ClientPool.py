@@ -0,0 +1,116 @@
+#!python3
+
+"""
+A process-wide pool of shared S3 clients.
+
+Creating a boto3 client is expensive (the service model has to be
+loaded and every new connection pays for a TLS handshake), so every
+S3Session using the same credentials and settings shares one client.
+Low-level boto3 clients are thread-safe, so a shared client can be
+used by several worker threads at the same time; its connection pool
+keeps connections alive between requests.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import logging
+import threading
+debugLogger = logging.getLogger(__name__)
+
+# Third-party library imports
+from boto3.session import Session
+from botocore.config import Config
+
+
+########################################################################
+# Maximum number of connections kept open by each client. This should
+# be at least the number of threads expected to use a client at once.
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_RETRIES = 5
+
+_clients = {}
+_warmed_up = set()
+_lock = threading.Lock()
+
+
+########################################################################
+def get_client(access_key, secret_key, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+               max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Return the shared S3 client for these credentials and settings,
+    creating it on first use.
+
+    Parameters
+    ==========
+    access_key: <string>
+        AWS Access Key.
+
+    secret_key: <string>
+        AWS Secret Key.
+
+    max_pool_connections: <integer>
+        Maximum number of connections kept open by the client.
+
+    max_retries: <integer>
+        Maximum number of attempts made for each request.
+
+    Returns
+    =======
+    <botocore.client.S3>
+    """
+    key = (access_key, secret_key, max_pool_connections, max_retries)
+
+    # boto3 sessions are not thread-safe, so clients are only ever
+    # created while holding the lock.
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Retries are applied by botocore to every request, which
+            # includes each individual part of a multipart transfer.
+            config = Config(retries={"max_attempts": max_retries, "mode": "standard"},
+                            max_pool_connections=max_pool_connections,
+                            tcp_keepalive=True)
+            session = Session(aws_access_key_id=access_key,
+                              aws_secret_access_key=secret_key)
+            client = session.client("s3", config=config)
+            _clients[key] = client
+            debugLogger.debug("Created shared S3 client ({} connections).".format(max_pool_connections))
+
+    return client
+
+
+def warm_up(client, bucket_name):
+    """
+    Open a connection to 'bucket_name' in a background thread.
+
+    This resolves the bucket's endpoint and completes the TLS handshake
+    ahead of the first real request, without blocking the caller. Each
+    client/bucket pair is only warmed up once.
+    """
+    key = (id(client), bucket_name)
+    with _lock:
+        if key in _warmed_up:
+            return
+        _warmed_up.add(key)
+
+    thread = threading.Thread(target=_warm_up, args=(client, bucket_name),
+                              name="S3WarmUp", daemon=True)
+    thread.start()
+
+
+def _warm_up(client, bucket_name):
+    try:
+        client.head_bucket(Bucket=bucket_name)
+    except Exception as err:
+        # Any response, even an error, leaves a warm connection behind.
+        debugLogger.debug("S3 warm-up request returned: {}".format(err))
+
+
+def clear():
+    """
+    Forget all shared clients, e.g. after credentials have changed.
+    """
+    with _lock:
+        _clients.clear()
+        _warmed_up.clear()
@@ -0,0 +1,110 @@
+#!python3
+
+"""
+A persistent cache of the S3 ETags of local files.
+
+Hashing a multi-GB file takes a long time, so the single-part (MD5) and
+multipart ETags of each file are stored in a SQLite database keyed by
+filepath and part size. An entry is only reused while the file's inode,
+size and modification time are unchanged, so any edit to the file
+causes it to be hashed again.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import sqlite3
+import logging
+import threading
+debugLogger = logging.getLogger(__name__)
+
+# Local library imports
+from modules.s3Integrity import hash_file
+
+
+########################################################################
+class HashCache(object):
+    """
+    SQLite-backed cache of local file ETags.
+    """
+
+    def __init__(self, database_filepath):
+        """
+        Parameters
+        ==========
+        database_filepath: <string>
+            Filepath to the SQLite database. It will be created if it
+            does not already exist.
+        """
+        directory = os.path.dirname(database_filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_filepath, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                " path TEXT NOT NULL,"
+                " part_size INTEGER NOT NULL,"
+                " inode INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " md5 TEXT NOT NULL,"
+                " multipart_etag TEXT NOT NULL,"
+                " PRIMARY KEY (path, part_size))")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_etags(self, filepath, part_size):
+        """
+        Return the ETags of a local file, hashing it only if it has
+        changed since it was last hashed.
+
+        Parameters
+        ==========
+        filepath: <string>
+            Filepath to the file of interest.
+
+        part_size: <integer>
+            Part size used for the multipart ETag.
+
+        Returns
+        =======
+        <tuple> of (<string> MD5 checksum, <string> multipart ETag)
+        """
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT md5, multipart_etag FROM file_hashes"
+                " WHERE path = ? AND part_size = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (path, part_size, stat.st_ino, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row
+
+        debugLogger.debug("Hashing '{}'.".format(path))
+        hasher = hash_file(path, part_size)
+        etags = (hasher.get_md5(), hasher.get_multipart_etag())
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, part_size, stat.st_ino, stat.st_size, stat.st_mtime_ns) + etags)
+
+        return etags
+
+    def matches(self, filepath, etag, part_size):
+        """
+        Return True if 'etag' (with or without quotes) is the ETag of a
+        local file uploaded with 'part_size' parts.
+        """
+        md5, multipart_etag = self.get_etags(filepath, part_size)
+        etag = etag.strip('"')
+        if "-" in etag:
+            return etag == multipart_etag
+        return etag == md5
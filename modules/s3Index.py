@@ -0,0 +1,286 @@
+#!python3
+
+"""
+A local, persistent index of the contents of S3 buckets.
+
+Listing a bucket with hundreds of thousands of keys takes hundreds of
+requests. The BucketIndex keeps the key, size, ETag and modification
+date of every listed object in a SQLite database, so browsing and
+searching the bucket afterwards is answered locally in milliseconds
+and works offline.
+
+The index is only as current as its last refresh, so a prefix is only
+answered from the index until its refresh is older than the index's
+maximum age. A prefix can be refreshed in full, which also removes keys deleted from S3, or
+incrementally, which only lists keys sorting after the last indexed key
+and so suits append-only layouts such as timestamped logs.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+debugLogger = logging.getLogger(__name__)
+
+
+########################################################################
+# Number of seconds a refreshed prefix is answered from the index.
+DEFAULT_MAX_AGE = 300.0
+
+
+########################################################################
+IndexEntry = namedtuple("IndexEntry", ["key", "size", "etag", "last_modified"])
+
+
+########################################################################
+class BucketIndex(object):
+    """
+    SQLite-backed index of S3 object listings.
+    """
+
+    def __init__(self, database_filepath, max_age=DEFAULT_MAX_AGE):
+        """
+        Parameters
+        ==========
+        database_filepath: <string>
+            Filepath to the SQLite database. It will be created if it
+            does not already exist. Use ":memory:" for an index which
+            is not persisted.
+
+        max_age: <float> or <None>
+            Number of seconds after its last refresh that a prefix is
+            still covered by the index, or None to never expire.
+        """
+        self.max_age = max_age
+        directory = os.path.dirname(database_filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_filepath, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                " bucket TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " etag TEXT NOT NULL,"
+                " last_modified REAL NOT NULL,"
+                " generation INTEGER NOT NULL,"
+                " PRIMARY KEY (bucket, key))")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS objects_size ON objects (bucket, size)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS prefixes ("
+                " bucket TEXT NOT NULL,"
+                " prefix TEXT NOT NULL,"
+                " refreshed REAL NOT NULL,"
+                " PRIMARY KEY (bucket, prefix))")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    #------------------------------------------------------------------
+    def refresh(self, bucket, prefix, pages, incremental=False):
+        """
+        Update the index from a ListObjectsV2 listing.
+
+        Parameters
+        ==========
+        bucket: <string>
+            Name of the bucket which was listed.
+
+        prefix: <string>
+            Prefix which was listed. Use "" for the whole bucket.
+
+        pages: iterable of <dictionaries>
+            ListObjectsV2 response pages, listed without a delimiter.
+
+        incremental: <boolean>
+            Set True if the listing only covers keys after
+            get_last_key(), in which case no keys are removed. Set
+            False if it covers the whole prefix, in which case indexed
+            keys missing from the listing are removed.
+
+        Returns
+        =======
+        <integer> Number of objects listed.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MAX(generation) FROM objects WHERE bucket = ?", (bucket,)).fetchone()
+        generation = (row[0] or 0) + 1
+
+        # Each page is written in its own transaction, so lookups are
+        # not blocked for the duration of a long listing.
+        listed = 0
+        for page in pages:
+            rows = [(bucket, item["Key"], item["Size"], item["ETag"],
+                     item["LastModified"].timestamp(), generation)
+                    for item in page.get("Contents", [])]
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)", rows)
+            listed += len(rows)
+
+        with self._lock, self._connection:
+            if incremental is False:
+                self._connection.execute(
+                    "DELETE FROM objects WHERE bucket = ? AND substr(key, 1, ?) = ?"
+                    " AND generation < ?",
+                    (bucket, len(prefix), prefix, generation))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO prefixes VALUES (?, ?, ?)", (bucket, prefix, time.time()))
+
+        debugLogger.debug("Indexed {} objects under '{}/{}'.".format(listed, bucket, prefix))
+        return listed
+
+    def put(self, bucket, key, size, etag, last_modified):
+        """
+        Add or update a single object, e.g. after it was uploaded.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?,"
+                " (SELECT COALESCE(MAX(generation), 0) FROM objects WHERE bucket = ?))",
+                (bucket, key, size, etag, last_modified.timestamp(), bucket))
+
+    def remove(self, bucket, keys):
+        """
+        Remove objects, e.g. after they were deleted.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM objects WHERE bucket = ? AND key = ?",
+                [(bucket, key) for key in keys])
+
+    def clear(self, bucket=None):
+        """
+        Remove every object of 'bucket', or of every bucket if None.
+        """
+        with self._lock, self._connection:
+            if bucket is None:
+                self._connection.execute("DELETE FROM objects")
+                self._connection.execute("DELETE FROM prefixes")
+            else:
+                self._connection.execute("DELETE FROM objects WHERE bucket = ?", (bucket,))
+                self._connection.execute("DELETE FROM prefixes WHERE bucket = ?", (bucket,))
+
+    #------------------------------------------------------------------
+    def covers(self, bucket, prefix):
+        """
+        Return True if 'prefix' lies inside a prefix which has been
+        refreshed within the last 'self.max_age' seconds.
+        """
+        oldest = float("-inf") if self.max_age is None else time.time() - self.max_age
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM prefixes WHERE bucket = ? AND substr(?, 1, length(prefix)) = prefix"
+                " AND refreshed >= ?",
+                (bucket, prefix, oldest)).fetchone()
+        return row is not None
+
+    def get_last_key(self, bucket, prefix):
+        """
+        Return the last indexed key under 'prefix', or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MAX(key) FROM objects WHERE bucket = ? AND substr(key, 1, ?) = ?",
+                (bucket, len(prefix), prefix)).fetchone()
+        return row[0]
+
+    def get(self, bucket, key):
+        """
+        Return the IndexEntry of 'key', or None if it isn't indexed.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT key, size, etag, last_modified FROM objects WHERE bucket = ? AND key = ?",
+                (bucket, key)).fetchone()
+        return None if row is None else _to_entry(row)
+
+    def get_contents(self, bucket, prefix, include_subdirectories=True):
+        """
+        Return the indexed keys under 'prefix' in the same form as
+        S3Session.get_contents(): when 'include_subdirectories' is
+        False, sub-directories are returned once, without a trailing
+        "/", ahead of the keys.
+        """
+        with self._lock:
+            keys = [row[0] for row in self._connection.execute(
+                "SELECT key FROM objects WHERE bucket = ? AND key >= ? AND substr(key, 1, ?) = ?"
+                " ORDER BY key",
+                (bucket, prefix, len(prefix), prefix))]
+
+        if include_subdirectories is True:
+            return keys
+
+        folders = []
+        files = []
+        for key in keys:
+            separator = key.find("/", len(prefix))
+            if separator < 0:
+                files.append(key)
+            elif not folders or folders[-1] != key[:separator]:
+                folders.append(key[:separator])
+        return folders + files
+
+    def search(self, bucket, prefix="", pattern=None, min_size=None, max_size=None):
+        """
+        Search the indexed objects.
+
+        Parameters
+        ==========
+        bucket: <string>
+            Name of the bucket to search.
+
+        prefix: <string>
+            Only keys starting with 'prefix' are returned.
+
+        pattern: <string> or <None>
+            Unix shell-style pattern the whole key must match, e.g.
+            "logs/*/2020-*.csv". Matching is case sensitive and "*"
+            also matches "/".
+
+        min_size, max_size: <integer> or <None>
+            Inclusive bounds of the object size in bytes.
+
+        Returns
+        =======
+        <list> of <IndexEntry>, sorted by key.
+        """
+        query = ("SELECT key, size, etag, last_modified FROM objects"
+                 " WHERE bucket = ? AND key >= ? AND substr(key, 1, ?) = ?")
+        parameters = [bucket, prefix, len(prefix), prefix]
+        if pattern is not None:
+            query += " AND key GLOB ?"
+            parameters.append(pattern)
+        if min_size is not None:
+            query += " AND size >= ?"
+            parameters.append(min_size)
+        if max_size is not None:
+            query += " AND size <= ?"
+            parameters.append(max_size)
+        query += " ORDER BY key"
+
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [_to_entry(row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+
+#######################################################################
+def _to_entry(row):
+    key, size, etag, last_modified = row
+    return IndexEntry(key, size, etag, datetime.fromtimestamp(last_modified, timezone.utc))
@@ -0,0 +1,159 @@
+#!python3
+
+"""
+Helpers to verify data transferred to and from S3 against its ETag.
+
+For objects uploaded in a single part (without SSE-KMS encryption) the
+ETag is the MD5 checksum of the data. For multipart uploads it is the
+MD5 checksum of the concatenated binary MD5 checksums of each part,
+followed by "-" and the number of parts, e.g. "9b2cf535f27731c9-3".
+
+EtagHasher computes both forms incrementally, so data can be verified
+while it is being streamed rather than with a second pass over it.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import mmap
+import hashlib
+
+
+########################################################################
+class EtagHasher(object):
+    """
+    Incrementally compute the single-part and multipart ETags of a
+    stream of data.
+    """
+
+    def __init__(self, part_size):
+        """
+        Parameters
+        ==========
+        part_size: <integer>
+            Size in bytes of each part, used for the multipart ETag.
+        """
+        self.part_size = part_size
+        self.total_bytes = 0
+        self._md5 = hashlib.md5()
+        self._part_md5 = hashlib.md5()
+        self._part_bytes = 0
+        self._part_digests = []
+
+    def update(self, data):
+        """
+        Add the next block of data, which may span part boundaries.
+        """
+        self._md5.update(data)
+        self.total_bytes += len(data)
+
+        view = memoryview(data)
+        while view:
+            size = min(len(view), self.part_size - self._part_bytes)
+            self._part_md5.update(view[:size])
+            self._part_bytes += size
+            view = view[size:]
+
+            if self._part_bytes == self.part_size:
+                self._part_digests.append(self._part_md5.digest())
+                self._part_md5 = hashlib.md5()
+                self._part_bytes = 0
+
+    def get_md5(self):
+        """
+        Return the hex MD5 checksum of all the data, which is the ETag
+        of a single part upload.
+        """
+        return self._md5.hexdigest()
+
+    def get_multipart_etag(self):
+        """
+        Return the ETag of the data if it was uploaded in parts of
+        'self.part_size' bytes.
+        """
+        digests = list(self._part_digests)
+        if self._part_bytes > 0 or not digests:
+            digests.append(self._part_md5.digest())
+        composite = hashlib.md5(b"".join(digests)).hexdigest()
+        return "{}-{}".format(composite, len(digests))
+
+    def matches(self, etag):
+        """
+        Return True if 'etag' (with or without quotes) matches the data.
+        """
+        etag = etag.strip('"')
+        if "-" in etag:
+            return etag == self.get_multipart_etag()
+        return etag == self.get_md5()
+
+
+class HashingReader(object):
+    """
+    Wrap a readable binary stream so that everything read from it is
+    added to an EtagHasher.
+
+    The wrapper is deliberately not seekable, so the transfer engine
+    reads the stream once, from start to end.
+    """
+
+    def __init__(self, fileobj, hasher):
+        self._fileobj = fileobj
+        self.hasher = hasher
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+
+#######################################################################
+def hash_file(filepath, part_size, hasher=None, end=None):
+    """
+    Feed a local file into an EtagHasher.
+
+    The file is memory-mapped, so even very large files are hashed
+    without copying them through Python buffers.
+
+    Parameters
+    ==========
+    filepath: <string>
+        Filepath to the file of interest.
+
+    part_size: <integer>
+        Size in bytes of each part, used for the multipart ETag.
+
+    hasher: <EtagHasher> or <None>
+        Existing hasher to add the file's data to.
+
+    end: <integer> or <None>
+        Only hash the first 'end' bytes of the file.
+
+    Returns
+    =======
+    <EtagHasher>
+    """
+    if hasher is None:
+        hasher = EtagHasher(part_size)
+
+    size = os.path.getsize(filepath)
+    if end is not None:
+        size = min(size, end)
+
+    # Zero-byte files cannot be memory-mapped.
+    if size == 0:
+        return hasher
+
+    with open(filepath, "rb") as rf:
+        with mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, size, part_size):
+                    hasher.update(view[start:min(start + part_size, size)])
+            finally:
+                view.release()
+
+    return hasher
@@ -0,0 +1,109 @@
+#!python3
+
+"""
+A bounded cache of S3 object metadata.
+
+S3Session uses this cache to avoid repeating HEAD requests for keys
+which are polled frequently. Entries are evicted in least recently
+used order once the cache is full, and are considered stale once they
+are older than the time-to-live (TTL). Stale entries are not thrown
+away because their ETag can still be used to revalidate them with a
+cheap conditional request.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import time
+import threading
+from collections import OrderedDict
+
+
+########################################################################
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 30.0  # seconds
+
+
+########################################################################
+class MetadataCache(object):
+    """
+    Thread-safe LRU + TTL cache of S3 object metadata keyed by S3 key.
+
+    A cached value of None records that the key does not exist.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        """
+        Parameters
+        ==========
+        max_entries: <integer>
+            Maximum number of keys held in the cache.
+
+        ttl: <float>
+            Number of seconds for which an entry is considered fresh.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        Look up the cached metadata of an S3 key.
+
+        Returns
+        =======
+        If the key is cached: <tuple> of (metadata, is_fresh)
+            'metadata' is the cached record or <None> if the key was
+            not found in S3. 'is_fresh' is a <boolean> which is False once
+            the entry is older than the TTL.
+
+        If the key is not cached: <None>
+        """
+        with self._lock:
+            try:
+                metadata, timestamp = self._entries[key]
+            except KeyError:
+                return None
+            self._entries.move_to_end(key)
+
+        is_fresh = (time.monotonic() - timestamp) < self.ttl
+        return metadata, is_fresh
+
+    def put(self, key, metadata):
+        """
+        Store the metadata of an S3 key, evicting the least recently
+        used entry if the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = (metadata, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key):
+        """
+        Reset the age of an entry, e.g. after it has been revalidated.
+        """
+        with self._lock:
+            try:
+                metadata, _ = self._entries[key]
+            except KeyError:
+                return
+            self._entries[key] = (metadata, time.monotonic())
+            self._entries.move_to_end(key)
+
+    def invalidate(self, key=None):
+        """
+        Remove an S3 key from the cache. If 'key' is None then the whole
+        cache is cleared.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
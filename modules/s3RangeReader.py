@@ -0,0 +1,165 @@
+#!python3
+
+"""
+A seekable, read-only file-like view of an S3 Object.
+
+Only the blocks of the object which are actually read are fetched, with
+ranged GET requests, and recently read blocks are kept in a small LRU
+cache. Tools which seek around a file, such as zipfile reading the
+central directory at the end of an archive, can therefore list or
+extract members of a remote archive while fetching only a fraction of
+it, e.g.
+
+    with s3.open_object("releases", "build.zip") as rf:
+        names = zipfile.ZipFile(rf).namelist()
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import io
+from collections import OrderedDict
+
+
+########################################################################
+# Size of each block fetched from S3, and the number of blocks cached.
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_BLOCKS = 32
+
+
+########################################################################
+class RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable binary stream backed by cached ranged reads.
+
+    Instances are not thread-safe; open a reader per thread instead.
+    """
+
+    def __init__(self, fetch, size, block_size=DEFAULT_BLOCK_SIZE,
+                 max_blocks=DEFAULT_MAX_BLOCKS, name=None):
+        """
+        Parameters
+        ==========
+        fetch: <callable>
+            Called as fetch(start, end) to return the bytes from 'start'
+            up to (but excluding) 'end' of the remote object.
+
+        size: <integer>
+            Total size of the remote object in bytes.
+
+        block_size: <integer>
+            Number of bytes fetched per block. Consecutive uncached
+            blocks are fetched with a single request.
+
+        max_blocks: <integer>
+            Maximum number of blocks held in the cache.
+
+        name: <string> or <None>
+            Name reported by the 'name' attribute, e.g. the S3 key.
+        """
+        super(RangeReader, self).__init__()
+        self.size = size
+        self.name = name
+        self.block_size = block_size
+        self.max_blocks = max(1, max_blocks)
+        self.requests = 0
+        self._fetch = fetch
+        self._position = 0
+        self._blocks = OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._check_closed()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._check_closed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({}, should be 0, 1 or 2)".format(whence))
+
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        self._check_closed()
+        view = memoryview(buffer).cast("B")
+        start = self._position
+        end = min(start + len(view), self.size)
+        if start >= end:
+            return 0
+
+        first_block = start // self.block_size
+        last_block = (end - 1) // self.block_size
+        self._load_blocks(first_block, last_block)
+
+        written = 0
+        for index in range(first_block, last_block + 1):
+            block = self._blocks[index]
+            block_start = index * self.block_size
+            lower = max(start, block_start) - block_start
+            upper = min(end, block_start + len(block)) - block_start
+            view[written:written + upper - lower] = block[lower:upper]
+            written += upper - lower
+
+        self._position += written
+        return written
+
+    def readall(self):
+        return self.read(max(0, self.size - self._position))
+
+    def close(self):
+        self._blocks.clear()
+        super(RangeReader, self).close()
+
+    #------------------------------------------------------------------
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _load_blocks(self, first_block, last_block):
+        """
+        Make sure blocks 'first_block' to 'last_block' are cached,
+        fetching each run of consecutive missing blocks in one request.
+        """
+        index = first_block
+        while index <= last_block:
+            if index in self._blocks:
+                index += 1
+                continue
+
+            run_end = index
+            while run_end + 1 <= last_block and run_end + 1 not in self._blocks:
+                run_end += 1
+
+            start = index * self.block_size
+            end = min((run_end + 1) * self.block_size, self.size)
+            data = self._fetch(start, end)
+            self.requests += 1
+            if len(data) != end - start:
+                raise IOError("Expected {} bytes from offset {}, received {}.".format(
+                    end - start, start, len(data)))
+
+            for block in range(index, run_end + 1):
+                offset = (block - index) * self.block_size
+                self._blocks[block] = data[offset:offset + self.block_size]
+            index = run_end + 1
+
+        # Evict the least recently used blocks, but never those which
+        # are about to be read.
+        for index in range(first_block, last_block + 1):
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > max(self.max_blocks, last_block - first_block + 1):
+            self._blocks.popitem(last=False)
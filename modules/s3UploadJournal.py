@@ -0,0 +1,140 @@
+#!python3
+
+"""
+A persistent journal of in-flight S3 multipart uploads.
+
+Each multipart upload is recorded with its upload ID, the fingerprint
+(path, size and modification time) of the local file being uploaded and
+the ETag of every part as soon as it completes. If the application is
+closed part way through an upload, the next upload of the same,
+unchanged file to the same key carries on from the completed parts
+instead of starting over.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+
+########################################################################
+JournalEntry = namedtuple("JournalEntry", ["bucket", "key", "upload_id", "src_filepath",
+                                           "size", "mtime_ns", "part_size", "started", "parts"])
+
+
+########################################################################
+class UploadJournal(object):
+    """
+    SQLite-backed record of multipart uploads and their completed parts.
+    """
+
+    def __init__(self, database_filepath):
+        """
+        Parameters
+        ==========
+        database_filepath: <string>
+            Filepath to the SQLite database. It will be created if it
+            does not already exist.
+        """
+        directory = os.path.dirname(database_filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_filepath, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " upload_id TEXT PRIMARY KEY,"
+                " bucket TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " src_filepath TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " part_size INTEGER NOT NULL,"
+                " started REAL NOT NULL)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS parts ("
+                " upload_id TEXT NOT NULL,"
+                " part_number INTEGER NOT NULL,"
+                " etag TEXT NOT NULL,"
+                " PRIMARY KEY (upload_id, part_number))")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    #------------------------------------------------------------------
+    def start(self, bucket, key, upload_id, src_filepath, part_size):
+        """
+        Record a new multipart upload of the local file 'src_filepath'.
+        """
+        path = os.path.abspath(src_filepath)
+        stat = os.stat(path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, bucket, key, path, stat.st_size, stat.st_mtime_ns,
+                 part_size, time.time()))
+
+    def add_part(self, upload_id, part_number, etag):
+        """
+        Record a completed part.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO parts VALUES (?, ?, ?)", (upload_id, part_number, etag))
+
+    def remove(self, upload_id):
+        """
+        Forget an upload, e.g. once it has been completed or aborted.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM parts WHERE upload_id = ?", (upload_id,))
+            self._connection.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+
+    #------------------------------------------------------------------
+    def find(self, bucket, key):
+        """
+        Return the JournalEntry of each recorded upload to 'key'.
+        """
+        return self._select("WHERE bucket = ? AND key = ?", (bucket, key))
+
+    def get_uploads(self, bucket):
+        """
+        Return the JournalEntry of each recorded upload to 'bucket'.
+        """
+        return self._select("WHERE bucket = ?", (bucket,))
+
+    def _select(self, condition, parameters):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT bucket, key, upload_id, src_filepath, size, mtime_ns, part_size, started"
+                " FROM uploads " + condition + " ORDER BY started", parameters).fetchall()
+            entries = []
+            for row in rows:
+                parts = dict(self._connection.execute(
+                    "SELECT part_number, etag FROM parts WHERE upload_id = ?", (row[2],)))
+                entries.append(JournalEntry(*row, parts=parts))
+        return entries
+
+
+#######################################################################
+def is_unchanged(entry, src_filepath):
+    """
+    Return True if 'src_filepath' is the file recorded in 'entry' and
+    hasn't been modified since the upload started.
+    """
+    path = os.path.abspath(src_filepath)
+    if path != entry.src_filepath:
+        return False
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns
@@ -0,0 +1,56 @@
+#!python3
+
+"""
+Tests of the S3 artifact cache.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+# Local imports
+from modules.s3ArtifactCache import ArtifactCache
+
+
+########################################################################
+class ArtifactCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, name, data):
+        filepath = os.path.join(self.directory, name)
+        with open(filepath, "w") as wf:
+            wf.write(data)
+        return filepath
+
+    def test_restamped_hardlink_keeps_blob_recent(self):
+        cache = ArtifactCache(os.path.join(self.directory, "cache"), max_size=25,
+                              use_hardlinks=True)
+        cache.store("a", self._write("a", "a" * 10))
+        time.sleep(0.05)
+        cache.store("b", self._write("b", "b" * 10))
+        time.sleep(0.05)
+
+        # Using "a" and then stamping the placed copy with an old
+        # modification date, as sync_down() does, must not make "a" the
+        # next blob to evict.
+        placed_filepath = os.path.join(self.directory, "placed")
+        self.assertTrue(cache.fetch("a", placed_filepath))
+        os.utime(placed_filepath, (1000, 1000))
+        time.sleep(0.05)
+
+        cache.store("c", self._write("c", "c" * 10))
+        self.assertTrue(cache.contains("a"))
+        self.assertFalse(cache.contains("b"))
+        self.assertEqual(os.stat(placed_filepath).st_mtime, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
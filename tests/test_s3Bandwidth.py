@@ -0,0 +1,66 @@
+#!python3
+
+"""
+Tests of the prioritised bandwidth limiter.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import time
+import threading
+import unittest
+
+# Local imports
+from modules.s3Bandwidth import (BandwidthLimiter, PRIORITY_INTERACTIVE, PRIORITY_BULK,
+                                 THROTTLE_CHUNK_SIZE)
+
+
+########################################################################
+RATE = 40 * THROTTLE_CHUNK_SIZE
+DURATION = 2.0
+
+
+########################################################################
+class BandwidthLimiterTest(unittest.TestCase):
+
+    def _transfer(self, limiter, priority, deadline, totals):
+        with limiter.activity(priority):
+            while time.monotonic() < deadline:
+                limiter.consume(THROTTLE_CHUNK_SIZE, priority)
+                totals[priority] += THROTTLE_CHUNK_SIZE
+
+    def _run(self, limiter, priorities):
+        # Drain the initial burst, so only the steady rate is measured.
+        limiter.consume(limiter.rate, PRIORITY_INTERACTIVE)
+
+        totals = dict.fromkeys(priorities, 0)
+        deadline = time.monotonic() + DURATION
+        threads = [threading.Thread(target=self._transfer, args=(limiter, priority, deadline, totals))
+                   for priority in priorities]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {priority: total / DURATION for priority, total in totals.items()}
+
+    def test_interactive_alone_gets_cap(self):
+        rates = self._run(BandwidthLimiter(RATE), [PRIORITY_INTERACTIVE])
+        self.assertGreater(rates[PRIORITY_INTERACTIVE], 0.9 * RATE)
+        self.assertLess(rates[PRIORITY_INTERACTIVE], 1.1 * RATE)
+
+    def test_interactive_stays_near_cap_during_bulk(self):
+        limiter = BandwidthLimiter(RATE, yield_share=0.05)
+        rates = self._run(limiter, [PRIORITY_INTERACTIVE, PRIORITY_BULK])
+
+        self.assertGreater(rates[PRIORITY_INTERACTIVE], 0.85 * RATE)
+        self.assertLess(rates[PRIORITY_BULK], 0.15 * RATE)
+        self.assertLess(sum(rates.values()), 1.1 * RATE)
+
+    def test_bulk_alone_gets_cap(self):
+        rates = self._run(BandwidthLimiter(RATE), [PRIORITY_BULK])
+        self.assertGreater(rates[PRIORITY_BULK], 0.9 * RATE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+#!python3
+
+"""
+Tests of the S3 bucket index.
+
+Compatible with Python 3.x
+"""
+
+# Standard library imports
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+
+# Local imports
+from modules.s3Index import BucketIndex
+
+
+########################################################################
+PAGE = {"Contents": [{"Key": "logs/a.csv", "Size": 1, "ETag": '"a"',
+                      "LastModified": datetime(2020, 4, 4, tzinfo=timezone.utc)}]}
+
+
+########################################################################
+class BucketIndexTest(unittest.TestCase):
+
+    def test_covers_expires_after_max_age(self):
+        index = BucketIndex(":memory:", max_age=60)
+        index.refresh("bucket", "logs/", [PAGE])
+        self.assertTrue(index.covers("bucket", "logs/2020/"))
+        self.assertFalse(index.covers("bucket", "data/"))
+
+        with mock.patch("modules.s3Index.time.time", return_value=time.time() + 61):
+            self.assertFalse(index.covers("bucket", "logs/2020/"))
+
+    def test_covers_never_expires_without_max_age(self):
+        index = BucketIndex(":memory:", max_age=None)
+        index.refresh("bucket", "", [PAGE])
+
+        with mock.patch("modules.s3Index.time.time", return_value=time.time() + 10 ** 9):
+            self.assertTrue(index.covers("bucket", "logs/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
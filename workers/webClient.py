@@ -9,15 +9,29 @@ Last Updated: 29 March 2020 (Ali Al-Hakim)
 # Standard library Imports
 import os
 import time
+import asyncio
 import logging
+import threading
+from contextlib import contextmanager
 debugLogger = logging.getLogger(__name__)
 
 # Third-Party Library Imports
 from PyQt5 import QtCore
+from github import GithubException
+from botocore.exceptions import BotoCoreError, ClientError
 
 # Local Libray imports
+from modules import appdata
 from modules.amazonS3Client import S3Session
+from modules.asyncS3Client import AsyncS3Session
+from modules.s3ArtifactCache import ArtifactCache
+from modules.s3HashCache import HashCache
+from modules.s3Index import BucketIndex
+from modules.s3UploadJournal import UploadJournal
+from modules.s3Bandwidth import BandwidthLimiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
 from modules.pyGithubClient import PyGithubClient
+from modules.githubCache import ResponseCache
+from modules.githubScheduler import RateLimitError
 
 
 ########################################################################
@@ -37,7 +51,50 @@ class WebClient(QtCore.QObject):
         self.daemon = True
 
         self.s3 = S3Session(s3_bucket, s3_access_key, s3_secret_key)
+        self.s3.set_artifact_cache(ArtifactCache(appdata.S3_ARTIFACT_CACHE_DIRECTORY,
+                                                 appdata.S3_ARTIFACT_CACHE_MAX_SIZE))
+        self.s3.set_hash_cache(HashCache(appdata.S3_HASH_CACHE_FILE))
+        self.s3.set_bucket_index(BucketIndex(appdata.S3_INDEX_FILE, appdata.S3_INDEX_MAX_AGE))
+        self.s3.set_upload_journal(UploadJournal(appdata.S3_UPLOAD_JOURNAL_FILE))
+
+        # Uploads run as background traffic so they yield to release
+        # checks and downloads when the bandwidth is limited.
+        self.bandwidth_limiter = None
+        if appdata.S3_MAX_BANDWIDTH is not None:
+            self.bandwidth_limiter = BandwidthLimiter(appdata.S3_MAX_BANDWIDTH)
+            self.s3.set_bandwidth_limiter(self.bandwidth_limiter)
+        self.s3_async = AsyncS3Session(self.s3)
+        self.s3_background = self.s3.with_priority(PRIORITY_BACKGROUND)
+        self.s3_background_async = AsyncS3Session(self.s3_background)
+
         self.gh = PyGithubClient(gitub_access_token)
+        self.gh.set_response_cache(ResponseCache(appdata.GITHUB_CACHE_FILE,
+                                                 appdata.GITHUB_CACHE_MAX_AGE))
+
+    @QtCore.pyqtSlot()
+    def start(self):
+        """
+        Abort abandoned multipart uploads and finish the uploads which
+        were interrupted when the application last closed.
+
+        This runs on a separate thread, so resuming large uploads
+        doesn't hold up the requests queued on this one.
+        """
+        thread = threading.Thread(target=self._recover_uploads, name="S3UploadRecovery")
+        thread.daemon = True
+        thread.start()
+
+    def _recover_uploads(self):
+        """
+        Abort stale multipart uploads and resume interrupted ones. S3
+        being unreachable, e.g. on an offline bench, only skips this
+        until the next launch.
+        """
+        try:
+            self.s3_background.abort_stale_uploads()
+            self.s3_background.resume_uploads()
+        except (BotoCoreError, ClientError) as err:
+            debugLogger.error("Recovering interrupted S3 uploads failed: {}".format(err))
 
     @QtCore.pyqtSlot()
     def shutdown(self):
@@ -47,6 +104,8 @@ class WebClient(QtCore.QObject):
         # -------------------------- #
         # Kill active processes here #
         # -------------------------- #
+        self.s3_async.close()
+        self.s3_background_async.close()
         self.sigShutdown.emit()
 
     @QtCore.pyqtSlot(str, str, str)
@@ -59,9 +118,40 @@ class WebClient(QtCore.QObject):
     @QtCore.pyqtSlot(str, str, str)
     def s3_upload(self, src_directory, s3_directory, filename):
         """
-        Upload a file to Amazon S3.
+        Upload a file to Amazon S3, unless an identical copy is already
+        there.
         """
-        self.s3.upload_file(src_directory, s3_directory, filename)
+        self.s3_background.upload_file(src_directory, s3_directory, filename,
+                                       skip_unchanged=True)
+
+    @QtCore.pyqtSlot(str, str, list)
+    def s3_download_many(self, s3_directory, dst_directory, filenames):
+        """
+        Download several files from Amazon S3 concurrently.
+        """
+        asyncio.run(self.s3_async.download_many(s3_directory, dst_directory, filenames))
+
+    @QtCore.pyqtSlot(str, str, list)
+    def s3_upload_many(self, src_directory, s3_directory, filenames):
+        """
+        Upload several files to Amazon S3 concurrently.
+        """
+        asyncio.run(self.s3_background_async.upload_many(src_directory, s3_directory, filenames))
+
+    @QtCore.pyqtSlot(str, list, str, str)
+    def s3_upload_packed(self, src_directory, filenames, s3_directory, archive_name):
+        """
+        Upload many small files to Amazon S3 as a single archive.
+        """
+        self.s3_background.upload_packed(src_directory, filenames, s3_directory, archive_name)
+
+    @QtCore.pyqtSlot(str)
+    def s3_refresh_index(self, s3_directory):
+        """
+        Re-list an S3 directory into the local index used for browsing
+        and searching the bucket.
+        """
+        self.s3_background.refresh_index(s3_directory)
 
     @QtCore.pyqtSlot(str)
     def handle_update_application(self, release_tag):
@@ -75,13 +165,32 @@ class WebClient(QtCore.QObject):
         """
         Handle a the request to retrieve release data.
         """
-        if query == "all":
-            self._gh_release_list()
-        elif query == "latest":
-            self._gh_release_latest()
-        else:
+        if query not in ("all", "latest"):
             raise RuntimeError("Invalid query to `get_release` method: {}".format(query))
 
+        # GitHub being unavailable or rate limited must not take down
+        # the worker thread; the query can simply be made again later.
+        try:
+            with self._interactive_activity():
+                if query == "all":
+                    self._gh_release_list()
+                else:
+                    self._gh_release_latest()
+        except (GithubException, RateLimitError) as err:
+            debugLogger.error("Release query '{}' failed: {}".format(query, err))
+
+    @contextmanager
+    def _interactive_activity(self):
+        """
+        Make background S3 transfers yield bandwidth while the block
+        runs.
+        """
+        if self.bandwidth_limiter is None:
+            yield
+        else:
+            with self.bandwidth_limiter.activity(PRIORITY_INTERACTIVE):
+                yield
+
     def _gh_release_latest(self):
         """
         Retrieve the latest software release from GitHub.